@@ -0,0 +1,190 @@
+"""Concurrency benchmark for borrow/return: hammers /borrow/<id> and /return/<id>.
+
+Usage: python bench_borrow_return.py [--processes 4] [--threads 4] [--seconds 10]
+                                     [--books 20] [--min-ops 50]
+
+Every worker (processes x threads) is a logged-in student with its own Flask test
+client. It borrows random books from a small shared pool, so most requests race for
+the same copies, and returns what it holds about half the time. The app runs with
+its normal (WAL) settings on a scratch database in a temporary directory
+(DATABASE_PATH), so books.db is never touched.
+
+Afterwards the database is checked against what the clients were told:
+  * no book has more than one open loan, and books.available matches open loans
+  * every "borrowed" flash has exactly one loan and one reading_history row,
+    every "returned" flash closed exactly one of them
+  * the maintained statistics counters match a recount
+  * no request failed with a server error or "database is locked"
+and the run fails (exit status 1) when any invariant breaks or throughput is below
+--min-ops requests per second.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from queue import Empty
+
+
+def setup_database(path, n_books, n_students):
+    from migrations import apply_migrations
+    conn = sqlite3.connect(path)
+    apply_migrations(conn)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.executemany('INSERT INTO books (title, author, genre, available) VALUES (?, ?, ?, 1)',
+                     [(f'Contended book {n}', 'Bench', 'Benchmark') for n in range(n_books)])
+    conn.executemany("INSERT INTO users (username, password, role) VALUES (?, 'x', 'student')",
+                     [(f'bench{n}',) for n in range(n_students)])
+    conn.commit()
+    book_ids = [row[0] for row in conn.execute("SELECT id FROM books WHERE genre = 'Benchmark'")]
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'bench%'")]
+    conn.close()
+    return book_ids, user_ids
+
+
+def run_client(server, user_id, book_ids, deadline, counts, lock):
+    client = server.app.test_client()
+    with client.session_transaction() as session:
+        session.update(logged_in=True, role='student', user_id=user_id, username=f'bench{user_id}')
+    held = []
+    local = Counter()
+    rng = random.Random(user_id)
+    while time.perf_counter() < deadline:
+        if held and rng.random() < 0.5:
+            book_id = held.pop(rng.randrange(len(held)))
+            action, ok_message = 'return', 'Book returned successfully!'
+        else:
+            book_id = rng.choice(book_ids)
+            action, ok_message = 'borrow', 'Book borrowed successfully!'
+        local['requests'] += 1
+        try:
+            response = client.get(f'/{action}/{book_id}')
+        except Exception:
+            # Development config propagates exceptions instead of answering 500
+            response = None
+        if response is None or response.status_code >= 500:
+            local['server_errors'] += 1
+            if action == 'return':
+                held.append(book_id)
+            continue
+        with client.session_transaction() as session:
+            messages = [message for _, message in session.pop('_flashes', [])]
+        if ok_message in messages:
+            local[f'{action}_ok'] += 1
+            if action == 'borrow':
+                held.append(book_id)
+        elif any('busy' in message for message in messages):
+            local['busy'] += 1
+            if action == 'return':
+                held.append(book_id)  # still on loan, try again later
+        else:
+            local[f'{action}_refused'] += 1
+            if action == 'return':
+                local['lost_returns'] += 1  # we held it, so a return must succeed
+    with lock:
+        counts.update(local)
+
+
+def run_process(n_threads, book_ids, user_ids, seconds, queue):
+    # Imported per process: each gets its own app, connection pool and threads
+    import server
+    counts, lock = Counter(), threading.Lock()
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=run_client, args=(server, user_id, book_ids, deadline, counts, lock))
+               for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.put(dict(counts))
+
+
+def check_invariants(path, counts):
+    conn = sqlite3.connect(path)
+    failures = []
+
+    def expect(label, actual, expected):
+        status = 'ok' if actual == expected else 'FAIL'
+        print(f"  {status:<4} {label}: {actual} (expected {expected})")
+        if actual != expected:
+            failures.append(label)
+
+    one = lambda sql: conn.execute(sql).fetchone()[0]
+    expect('books with more than one open loan', one('''
+        SELECT COUNT(*) FROM (SELECT book_id FROM borrow_log WHERE returned = 0 GROUP BY book_id HAVING COUNT(*) > 1)
+    '''), 0)
+    expect('books whose available flag disagrees with open loans', one('''
+        SELECT COUNT(*) FROM books b
+        WHERE b.available != NOT EXISTS (SELECT 1 FROM borrow_log bl WHERE bl.book_id = b.id AND bl.returned = 0)
+    '''), 0)
+    expect('loans recorded', one('SELECT COUNT(*) FROM borrow_log'), counts['borrow_ok'])
+    expect('loans returned', one('SELECT COUNT(*) FROM borrow_log WHERE returned = 1'), counts['return_ok'])
+    expect('reading_history rows', one('SELECT COUNT(*) FROM reading_history'), counts['borrow_ok'])
+    expect('open reading_history rows', one('SELECT COUNT(*) FROM reading_history WHERE return_date IS NULL'),
+           counts['borrow_ok'] - counts['return_ok'])
+    expect('current_borrows counter', one("SELECT value FROM library_stats WHERE name = 'current_borrows'"),
+           one('SELECT COUNT(*) FROM borrow_log WHERE returned = 0'))
+    expect('available_books counter', one("SELECT value FROM library_stats WHERE name = 'available_books'"),
+           one('SELECT COUNT(*) FROM books WHERE available = 1'))
+    expect('server errors', counts['server_errors'], 0)
+    expect('returns refused for a book the client held', counts['lost_returns'], 0)
+    conn.close()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help='clients per process')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--books', type=int, default=20, help='fewer books = more contention')
+    parser.add_argument('--min-ops', type=float, default=50, help='required requests per second')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        os.environ['FLASK_CONFIG'] = 'development'
+        os.environ['DATABASE_PATH'] = path
+        book_ids, user_ids = setup_database(path, args.books, args.processes * args.threads)
+
+        # fork: children inherit the environment above and import the app themselves
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        started = time.perf_counter()
+        processes = [context.Process(target=run_process,
+                                     args=(args.threads, book_ids, user_ids[n::args.processes], args.seconds, queue))
+                     for n in range(args.processes)]
+        for process in processes:
+            process.start()
+        counts = Counter()
+        for _ in processes:
+            try:
+                counts.update(queue.get(timeout=args.seconds + 300))
+            except Empty:
+                sys.exit('A worker process died before reporting; see its traceback above.')
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        throughput = counts['requests'] / args.seconds
+        print(f"{args.processes} processes x {args.threads} clients, {args.books} books, {elapsed:.1f}s")
+        print(f"  {counts['requests']} requests ({throughput:,.0f}/s): "
+              f"{counts['borrow_ok']} borrowed, {counts['borrow_refused']} borrows refused (already out), "
+              f"{counts['return_ok']} returned, {counts['busy']} busy after retries")
+        failures = check_invariants(path, counts)
+        if throughput < args.min_ops:
+            print(f"  FAIL throughput {throughput:,.0f}/s is below --min-ops {args.min_ops:,.0f}/s")
+            failures.append('throughput')
+    if failures:
+        print(f"FAILED: {', '.join(failures)}")
+        sys.exit(1)
+    print("All invariants hold.")
+
+
+if __name__ == '__main__':
+    main()
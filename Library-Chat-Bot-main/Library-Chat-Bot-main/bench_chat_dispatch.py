@@ -0,0 +1,84 @@
+"""Micro-benchmark of chat command dispatch.
+
+Usage: python bench_chat_dispatch.py [iterations]
+
+Times four things: parsing alone through the real admin/student registries, the
+same first command after padding the registry to 50+ commands (dispatch cost should
+not grow with the number of commands), intent classification of free-form messages,
+and the full POST /chat round trip through Flask. Commands that would hit the database
+are only parsed, never executed. The round trips are 'help' and a malformed admin
+command, which the admin registry answers with its usage line without any query (a
+malformed student command would not do: it falls through to the free-text intent
+path, which searches the catalog). The app runs on the in-memory testing database,
+so books.db is never touched.
+"""
+import os
+import sys
+import timeit
+
+os.environ.setdefault('FLASK_CONFIG', 'testing')
+
+from commands import CommandRegistry
+import server
+
+# (registry, message) -- one per command family, parsed but not run
+PARSE_CASES = [
+    (server.admin_commands, 'add book title:Dune author:Frank Herbert genre:Sci-Fi'),
+    (server.admin_commands, 'delete book 42'),
+    (server.admin_commands, 'sync full'),
+    (server.student_commands, 'search book introduction to algorithms'),
+    (server.student_commands, 'borrow 17'),
+    (server.student_commands, 'my borrowed books'),
+]
+
+
+def report(label, iterations, seconds):
+    print(f"{label:<55} {iterations / seconds:>12,.0f} ops/s  {seconds / iterations * 1e6:8.2f} us/op")
+
+
+def bench_parsing(iterations):
+    for registry, text in PARSE_CASES:
+        assert registry.match(text)[0] is not None, text
+        seconds = timeit.timeit(lambda: registry.match(text), number=iterations)
+        report(f"parse  {text[:45]!r}", iterations, seconds)
+
+
+def bench_registry_size(iterations):
+    # The first command's cost with 1 command registered vs. with 50 more behind it
+    for padding in (0, 50):
+        registry = CommandRegistry()
+        registry.command('borrow <book_id:int>')(lambda user_id, book_id: book_id)
+        for n in range(padding):
+            registry.command(f'extra{n} [thing] <arg{n}:int> note:<note{n}:text>')(lambda **kwargs: None)
+        seconds = timeit.timeit(lambda: registry.dispatch('borrow 17', user_id=1), number=iterations)
+        report(f"dispatch 'borrow 17' with {len(registry)} commands", iterations, seconds)
+
+
+def bench_intents(iterations):
+    for message in ('can i borrow the hobbit please', 'books about neural networks for beginners'):
+        seconds = timeit.timeit(lambda: server.intent_model.classify(message), number=iterations)
+        report(f"classify {message[:45]!r}", iterations, seconds)
+
+
+def bench_endpoint(iterations):
+    # 'help' and a malformed admin command exercise dispatch without running a query; the
+    # admin registry has no free-text fallback, so 'delete book abc' stops at its grammar
+    for role, message, expected in (('student', 'help', '📋'), ('admin', 'delete book abc', '❌ Format:')):
+        client = server.app.test_client()
+        with client.session_transaction() as sess:
+            sess['logged_in'] = True
+            sess['role'] = role
+            sess['user_id'] = 1
+        response = client.post('/chat', json={'message': message})
+        assert response.status_code == 200, response.status_code
+        assert response.get_json()['response'].startswith(expected), response.get_json()
+        seconds = timeit.timeit(lambda: client.post('/chat', json={'message': message}), number=iterations)
+        report(f"POST /chat {message!r} as {role}", iterations, seconds)
+
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    bench_parsing(iterations)
+    bench_registry_size(iterations)
+    bench_intents(iterations)
+    bench_endpoint(max(iterations // 20, 1))
@@ -0,0 +1,279 @@
+"""Per-route latency benchmark on a generated library, with JSON baselines.
+
+Usage: python bench_routes.py [--scale 1k|100k|10m] [--iterations 30] [--warmup 3]
+                              [--only SUBSTRING] [--data-dir bench_data]
+                              [--baseline-dir bench_baselines] [--save-baseline]
+                              [--tolerance 1.5] [--slack-ms 2]
+
+The first run at a scale fills <data-dir>/<scale>.db with generate_data.py and
+builds its catalog index next to it; later runs reuse both (delete them to start
+over). The app is imported with the 'benchmark' config on that database, and
+every GET route in the URL map is requested through the test client, logged in
+as an admin for /admin/* and as the busiest student otherwise, plus a set of
+read-only chat commands. Routes that change data (borrow, return, logout) and
+POST forms are left out.
+
+For each request it records the latency (response body included, so streamed
+exports and chat count in full) and the number of SQL statements it ran, counted
+with a trace callback on every pooled connection (statements run by triggers are
+not counted). Caches are warm after --warmup requests, so the numbers are the
+steady state a busy server sees.
+
+The results are compared with <baseline-dir>/routes-<scale>.json when it exists:
+a route regresses when its p95 exceeds the baseline's p95 * --tolerance +
+--slack-ms, or when it runs more queries than the baseline. Any regression (or a
+server error) makes the exit status 1. --save-baseline writes the results as the
+new baseline instead; latencies only compare on the same machine, query counts
+anywhere.
+
+The HTML templates are not part of this repository. Views whose template is
+missing render an empty page, so their database and Python work is measured but
+not the template itself.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+ROW_TABLES = ('books', 'categories', 'users', 'borrow_log', 'reading_history', 'fines')
+# Endpoints that change data or end the session
+SKIP_ENDPOINTS = {'static', 'logout', 'borrow_book_route', 'return_book_route'}
+# (name, role, message) for POST /chat; commands that only read
+CHAT_MESSAGES = [
+    ('chat help', 'student', 'help'),
+    ('chat search', 'student', 'search algorithms'),
+    ('chat list', 'student', 'list available books'),
+    ('chat my books', 'student', 'my books'),
+    ('chat fines', 'student', 'my fines'),
+    ('chat similar', 'student', 'similar {book_id}'),
+    ('chat free text', 'student', 'do you have anything on machine learning'),
+    ('chat admin list', 'admin', 'list books'),
+    ('chat admin cache stats', 'admin', 'cache stats'),
+]
+
+
+def prepare_data(scale, path, index_path):
+    """Generate the database for ``scale`` and its catalog index unless they exist."""
+    import generate_data
+    from catalog_index import build_index, save_index
+    from migrations import apply_migrations
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    apply_migrations(conn)
+    if not conn.execute('SELECT 1 FROM books LIMIT 1').fetchone():
+        print(f"Generating the {scale} dataset in {path} (once)...")
+        conn.execute('PRAGMA journal_mode = WAL')
+        generate_data.generate(conn, **generate_data.SCALES[scale])
+    if not os.path.exists(os.path.join(index_path, 'meta.json')):
+        conn.row_factory = sqlite3.Row
+        save_index(build_index(conn), index_path)
+    conn.close()
+
+
+def percentile(sorted_values, p):
+    # Nearest rank: the smallest value with at least p% of the samples at or below it
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(latencies, queries, status):
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        'status': status,
+        'queries': max(queries),
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(sum(latencies) / len(latencies)),
+        'max_ms': ms(latencies[-1]),
+    }
+
+
+class Bench:
+    def __init__(self, server, iterations, warmup):
+        self.server = server
+        self.iterations = iterations
+        self.warmup = warmup
+        self.statements = 0
+        server.db_pool.add_trace_hook(self._trace)
+        self.clients = {}
+
+    def _trace(self, statement):
+        # Statements run by triggers are traced as "-- TRIGGER ..." comments; EXPLAINs
+        # come from the slow-query log, not the route
+        if not statement.startswith(('--', 'EXPLAIN')):
+            self.statements += 1
+
+    def login(self, role, user_id, username):
+        client = self.server.app.test_client()
+        with client.session_transaction() as session:
+            session.update(logged_in=True, role=role, user_id=user_id, username=username)
+        self.clients[role] = client
+
+    def request(self, role, method, url, body):
+        client = self.clients[role]
+        self.statements = 0
+        started = time.perf_counter()
+        try:
+            response = client.open(url, method=method, json=body)
+            response.get_data()
+            response.close()
+            status = response.status_code
+        except Exception as e:
+            # TESTING propagates view errors instead of answering 500
+            print(f"  {method} {url}: {type(e).__name__}: {e}")
+            status = 500
+        return time.perf_counter() - started, self.statements, status
+
+    def measure(self, role, method, url, body=None):
+        for _ in range(self.warmup):
+            self.request(role, method, url, body)
+        latencies, queries = [], []
+        status = None
+        for _ in range(self.iterations):
+            elapsed, statements, status = self.request(role, method, url, body)
+            latencies.append(elapsed)
+            queries.append(statements)
+        return summarize(latencies, queries, status)
+
+
+def route_cases(server, book_id, student_id):
+    """(name, role, method, url, json body) for every benchmarked request."""
+    from flask import url_for
+    from image_pipeline import PLACEHOLDER
+
+    sample_args = {'book_id': book_id, 'kind': 'covers', 'filename': PLACEHOLDER, 'name': 'fines', 'fmt': 'csv'}
+    month_ago = (date.today() - timedelta(days=30)).isoformat()
+    cases = []
+    with server.app.test_request_context():
+        for rule in sorted(server.app.url_map.iter_rules(), key=lambda rule: rule.rule):
+            if 'GET' not in rule.methods or rule.endpoint in SKIP_ENDPOINTS:
+                continue
+            url = url_for(rule.endpoint, **{name: sample_args[name] for name in rule.arguments})
+            role = 'admin' if rule.rule.startswith('/admin') else 'student'
+            if rule.endpoint == 'admin_export':
+                url += f'?start={month_ago}'
+            cases.append((f'GET {rule.rule}', role, 'GET', url, None))
+        cases += [
+            ('GET /browse_books search', 'student', 'GET', url_for('browse_books', search='algorithms'), None),
+            ('GET /chat/stream list', 'student', 'GET', url_for('chat_stream', message='list available books'), None),
+            ('GET /admin/export borrow_log by user', 'admin', 'GET',
+             url_for('admin_export', name='borrow_log', fmt='jsonl', user_id=student_id), None),
+        ]
+    for name, role, message in CHAT_MESSAGES:
+        cases.append((name, role, 'POST', '/chat', {'message': message.format(book_id=book_id)}))
+    return cases
+
+
+def compare(results, baseline, tolerance, slack_ms):
+    """Print each route against the baseline; returns the names of regressed routes."""
+    regressions = []
+    print(f"{'route':<44} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>7}  vs baseline p95 / queries")
+    for name, result in results.items():
+        line = (f"{name:<44} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{result['queries']:>7}")
+        base = baseline.get(name)
+        problems = []
+        if result['status'] >= 500:
+            problems.append(f"status {result['status']}")
+        if base:
+            line += f"  {base['p95_ms']:.2f}ms / {base['queries']}"
+            if result['p95_ms'] > base['p95_ms'] * tolerance + slack_ms:
+                problems.append('slower')
+            if result['queries'] > base['queries']:
+                problems.append('more queries')
+        elif baseline:
+            line += '  (new)'
+        if problems:
+            line += '  REGRESSION: ' + ', '.join(problems)
+            regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=('1k', '100k', '10m'), default='1k')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--only', help='benchmark only routes whose name contains this')
+    parser.add_argument('--data-dir', default='bench_data')
+    parser.add_argument('--baseline-dir', default='bench_baselines')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed p95 slowdown factor')
+    parser.add_argument('--slack-ms', type=float, default=2.0, help='allowed p95 slowdown on top, in ms')
+    args = parser.parse_args()
+
+    path = os.path.join(args.data_dir, f'{args.scale}.db')
+    index_path = os.path.join(args.data_dir, f'{args.scale}-catalog_index')
+    # Before anything imports config, which reads them once
+    os.environ['FLASK_CONFIG'] = 'benchmark'
+    os.environ['DATABASE_PATH'] = path
+    os.environ['CATALOG_INDEX_PATH'] = index_path
+    prepare_data(args.scale, path, index_path)
+    import server
+    from jinja2 import BaseLoader, ChoiceLoader
+
+    class EmptyTemplates(BaseLoader):
+        def get_source(self, environment, template):
+            return '', None, lambda: True
+
+    server.app.jinja_env.loader = ChoiceLoader([server.app.jinja_env.loader, EmptyTemplates()])
+
+    conn = sqlite3.connect(path)
+    rows = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in ROW_TABLES}
+    admin_id = conn.execute("SELECT id FROM users WHERE username = 'admin' AND role = 'admin'").fetchone()[0]
+    # The student with the most loans: the largest dashboard, history and fines pages
+    student_id, username = conn.execute('''
+        SELECT u.id, u.username FROM users u
+        WHERE u.id = (SELECT user_id FROM borrow_log GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1)
+    ''').fetchone()
+    book_id = conn.execute('SELECT MIN(id) FROM books').fetchone()[0]
+    conn.close()
+
+    bench = Bench(server, args.iterations, args.warmup)
+    bench.login('admin', admin_id, 'admin')
+    bench.login('student', student_id, username)
+    print(f"{args.scale}: " + ', '.join(f'{count:,} {table}' for table, count in rows.items())
+          + f"; {args.iterations} requests per route after {args.warmup} warm-up")
+
+    results = {}
+    for name, role, method, url, body in route_cases(server, book_id, student_id):
+        if args.only and args.only not in name:
+            continue
+        results[name] = bench.measure(role, method, url, body)
+
+    baseline_path = os.path.join(args.baseline_dir, f'routes-{args.scale}.json')
+    baseline = {}
+    if not args.save_baseline and os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)['routes']
+    regressions = compare(results, baseline, args.tolerance, args.slack_ms)
+
+    if args.save_baseline:
+        os.makedirs(args.baseline_dir, exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump({
+                'scale': args.scale,
+                'rows': rows,
+                'iterations': args.iterations,
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'machine': platform.machine(),
+                'routes': results,
+            }, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline saved to {baseline_path}")
+    if regressions:
+        print(f"FAILED: {len(regressions)} regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
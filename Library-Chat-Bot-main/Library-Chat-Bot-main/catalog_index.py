@@ -0,0 +1,262 @@
+"""Semantic catalog search: ranked "books about ..." queries and similar books.
+
+Usage: python catalog_index.py [database] [output]     (default: books.db catalog_index)
+
+Every book is a TF-IDF vector over hashed words and word pairs from its title (counted
+twice), author, genre, category name and category description; the description is
+what lets "neural networks for beginners" find books whose own title never says so.
+Queries are ranked by cosine similarity.
+
+The index is built offline into a directory of .npy arrays (an inverted index: for each
+feature the books that have it and their weights) and memory-mapped at startup, so
+workers share the pages and only touch the posting lists a query needs. Books added,
+edited or deleted after the build are picked up from the catalog_changes log (filled by
+triggers, migration 9) into a small in-memory delta on the next query; rebuild offline
+from time to time to fold the delta back in.
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+N_FEATURES = 1 << 20
+TITLE_WEIGHT = 2
+
+BOOKS_SQL = '''
+    SELECT b.id, b.title, b.author, b.genre, c.name as category, c.description
+    FROM books b
+    LEFT JOIN categories c ON c.id = b.category_id
+    ORDER BY b.id -- offline index build reads every book
+'''
+CHANGED_BOOKS_SQL = '''
+    SELECT b.id, b.title, b.author, b.genre, c.name as category, c.description
+    FROM books b
+    LEFT JOIN categories c ON c.id = b.category_id
+    WHERE b.id IN (SELECT value FROM json_each(?))
+'''
+CHANGES_SQL = 'SELECT seq, book_id FROM catalog_changes WHERE seq > ? ORDER BY seq'
+LAST_CHANGE_SQL = 'SELECT COALESCE(MAX(seq), 0) FROM catalog_changes'
+
+_WORD = re.compile(r'[a-z0-9]+')
+_STOPWORDS = {
+    'a', 'an', 'and', 'the', 'of', 'for', 'to', 'in', 'on', 'by', 'with', 'about', 'at', 'from',
+    'is', 'are', 'be', 'it', 'its', 'or', 'as', 'me', 'my', 'i', 'you', 'some', 'any', 'books', 'book',
+}
+
+
+def _stem(word):
+    # Just enough to make plurals meet their singulars ("networks" -> "network")
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def _words(text):
+    return [_stem(w) for w in _WORD.findall((text or '').lower()) if w not in _STOPWORDS]
+
+
+def _add_features(counts, text, weight=1):
+    words = _words(text)
+    for feature in words + [f'{a} {b}' for a, b in zip(words, words[1:])]:
+        # crc32 rather than hash(): it must be the same in every process and Python version
+        index = zlib.crc32(feature.encode()) & (N_FEATURES - 1)
+        counts[index] = counts.get(index, 0) + weight
+
+
+def book_features(row):
+    counts = {}
+    _add_features(counts, row['title'], TITLE_WEIGHT)
+    for field in ('author', 'genre', 'category', 'description'):
+        _add_features(counts, row[field])
+    return counts
+
+
+def query_features(text):
+    counts = {}
+    _add_features(counts, text)
+    return counts
+
+
+class CatalogIndex:
+    def __init__(self, book_ids, indptr, postings, weights, idf, last_seq):
+        self.book_ids = book_ids        # (n_books,) sorted book ids; a book's position is its row
+        self.indptr = indptr            # (N_FEATURES + 1,) posting list bounds per feature
+        self.postings = postings        # book positions, grouped by feature
+        self.weights = weights          # float16 tf-idf weight of each posting, books are unit length
+        self.idf = idf                  # (N_FEATURES,)
+        self.last_seq = last_seq        # catalog_changes already reflected in the index
+        self._stale = np.zeros(len(book_ids), dtype=bool)
+        self._delta = {}                # book_id -> {feature: weight} for books changed since the build
+        self._delta_postings = {}       # feature -> {book_id: weight}, the same data inverted
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.book_ids) - int(self._stale.sum()) + len(self._delta)
+
+    def _vector(self, counts):
+        if not counts:
+            return {}
+        features = np.fromiter(counts, dtype=np.intp, count=len(counts))
+        values = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        values *= self.idf[features]
+        values /= np.linalg.norm(values)
+        return dict(zip(features.tolist(), values.tolist()))
+
+    def refresh(self, conn):
+        """Fold catalog_changes made since the last call into the delta; one PK range read when idle."""
+        changes = conn.execute(CHANGES_SQL, (self.last_seq,)).fetchall()
+        if not changes:
+            return 0
+        book_ids = sorted({row[1] for row in changes})
+        rows = {row['id']: row for row in conn.execute(CHANGED_BOOKS_SQL, (json.dumps(book_ids),))}
+        with self._lock:
+            for book_id in book_ids:
+                old = self._delta.pop(book_id, None)
+                for feature in old or ():
+                    self._delta_postings[feature].pop(book_id, None)
+                position = np.searchsorted(self.book_ids, book_id)
+                if position < len(self.book_ids) and self.book_ids[position] == book_id:
+                    self._stale[position] = True
+                if book_id in rows:
+                    vector = self._vector(book_features(rows[book_id]))
+                    self._delta[book_id] = vector
+                    for feature, weight in vector.items():
+                        self._delta_postings.setdefault(feature, {})[book_id] = weight
+            self.last_seq = max(self.last_seq, changes[-1][0])
+        return len(book_ids)
+
+    def _search_vectors(self, vectors, k, exclude=()):
+        # Scores for all queries at once: a (queries, books) matrix filled from the posting
+        # lists of each query's features, then one argpartition per row for the top k
+        scores = np.zeros((len(vectors), len(self.book_ids)), dtype=np.float32)
+        delta_scores = [{} for _ in vectors]
+        with self._lock:
+            for row, vector in enumerate(vectors):
+                for feature, weight in vector.items():
+                    start, end = self.indptr[feature], self.indptr[feature + 1]
+                    if end > start:
+                        # Positions within one posting list are unique, so fancy += is safe
+                        scores[row, self.postings[start:end]] += np.float32(weight) * self.weights[start:end]
+                    for book_id, book_weight in self._delta_postings.get(feature, {}).items():
+                        delta_scores[row][book_id] = delta_scores[row].get(book_id, 0.0) + weight * book_weight
+            scores[:, self._stale] = 0
+        for book_id in exclude:
+            position = np.searchsorted(self.book_ids, book_id)
+            if position < len(self.book_ids) and self.book_ids[position] == book_id:
+                scores[:, position] = 0
+
+        results = []
+        candidates = min(k, scores.shape[1])
+        top = np.argpartition(-scores, candidates - 1, axis=1)[:, :candidates] if candidates else \
+            np.empty((len(vectors), 0), dtype=np.intp)
+        for row in range(len(vectors)):
+            hits = [(int(self.book_ids[p]), float(scores[row, p])) for p in top[row] if scores[row, p] > 0]
+            hits += [(book_id, score) for book_id, score in delta_scores[row].items()
+                     if score > 0 and book_id not in exclude]
+            hits.sort(key=lambda hit: (-hit[1], hit[0]))
+            results.append(hits[:k])
+        return results
+
+    def search_many(self, conn, queries, k=10):
+        """Top-k (book_id, score) lists, best first, for a batch of free-text queries."""
+        self.refresh(conn)
+        return self._search_vectors([self._vector(query_features(q)) for q in queries], k)
+
+    def search(self, conn, query, k=10):
+        return self.search_many(conn, [query], k)[0]
+
+    def similar(self, conn, book_id, k=10):
+        """Books closest to ``book_id`` (itself excluded); empty if the book does not exist."""
+        self.refresh(conn)
+        row = conn.execute(CHANGED_BOOKS_SQL, (json.dumps([book_id]),)).fetchone()
+        if row is None:
+            return []
+        return self._search_vectors([self._vector(book_features(row))], k, exclude={book_id})[0]
+
+
+def build_index(conn):
+    """Build an in-memory index of every book; save_index() writes it out for mmap loading."""
+    # Read the change log position first: anything after it is replayed by refresh()
+    last_seq = conn.execute(LAST_CHANGE_SQL).fetchone()[0]
+    book_ids, doc_positions, features, counts = [], [], [], []
+    for row in conn.execute(BOOKS_SQL):
+        book_counts = book_features(row)
+        doc_positions.append(np.full(len(book_counts), len(book_ids), dtype=np.int32))
+        features.append(np.fromiter(book_counts, dtype=np.int32, count=len(book_counts)))
+        counts.append(np.fromiter(book_counts.values(), dtype=np.float32, count=len(book_counts)))
+        book_ids.append(row['id'])
+    n_books = len(book_ids)
+    doc_positions = np.concatenate(doc_positions) if doc_positions else np.empty(0, dtype=np.int32)
+    features = np.concatenate(features) if features else np.empty(0, dtype=np.int32)
+    counts = np.concatenate(counts) if counts else np.empty(0, dtype=np.float32)
+
+    df = np.bincount(features, minlength=N_FEATURES)
+    # Smoothed idf; words no book uses get the largest weight but match nothing
+    idf = (np.log((1 + n_books) / (1 + df)) + 1).astype(np.float32)
+    weights = (1 + np.log(counts)) * idf[features]
+    norms = np.sqrt(np.bincount(doc_positions, weights=weights * weights, minlength=n_books))
+    weights /= norms[doc_positions].astype(np.float32)
+
+    # Group postings by feature (CSC layout); stable sort keeps book positions ascending
+    order = np.argsort(features, kind='stable')
+    indptr = np.zeros(N_FEATURES + 1, dtype=np.int64)
+    np.cumsum(df, out=indptr[1:])
+    # float16 weights: ranking needs ~3 significant digits and the index is mostly postings
+    return CatalogIndex(np.array(book_ids, dtype=np.int64), indptr, doc_positions[order],
+                        weights[order].astype(np.float16), idf, last_seq)
+
+
+_ARRAYS = ('book_ids', 'indptr', 'postings', 'weights', 'idf')
+
+
+def save_index(index, path):
+    # Written next to the old index and swapped in, so a crash never leaves half an index
+    tmp = path + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in _ARRAYS:
+        np.save(os.path.join(tmp, name + '.npy'), getattr(index, name))
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'n_features': N_FEATURES, 'books': len(index.book_ids), 'last_seq': index.last_seq}, f)
+    if os.path.exists(path):
+        shutil.rmtree(path + '.old', ignore_errors=True)
+        os.rename(path, path + '.old')
+    os.rename(tmp, path)
+    shutil.rmtree(path + '.old', ignore_errors=True)
+
+
+def load_index(path, conn):
+    """Memory-map an index saved by save_index(); built in memory when missing or incompatible."""
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        print(f"DEBUG: Catalog index {path} not found, building it in memory.")
+        return build_index(conn)
+    if meta['n_features'] != N_FEATURES:
+        print(f"DEBUG: Catalog index {path} has a different layout, building it in memory.")
+        return build_index(conn)
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in _ARRAYS}
+    return CatalogIndex(last_seq=meta['last_seq'], **arrays)
+
+
+if __name__ == '__main__':
+    import sqlite3
+    database = sys.argv[1] if len(sys.argv) > 1 else 'books.db'
+    output = sys.argv[2] if len(sys.argv) > 2 else 'catalog_index'
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    started = time.perf_counter()
+    index = build_index(conn)
+    save_index(index, output)
+    conn.close()
+    print(f"Built catalog index: {len(index.book_ids)} books, {len(index.postings)} postings "
+          f"in {time.perf_counter() - started:.1f}s -> {output}")
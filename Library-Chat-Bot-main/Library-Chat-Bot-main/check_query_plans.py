@@ -0,0 +1,324 @@
+"""Run EXPLAIN QUERY PLAN on every SQL statement in the app and fail on full table scans.
+
+Usage: python check_query_plans.py [database]
+
+Two passes feed the check:
+
+- every SQL string literal in the app modules, as written;
+- every statement the app runs, as actually composed: the app is started on a
+  small generated library (generate_data.py) in a scratch directory, and every
+  GET route, chat command, listing page, export filter, borrow/return and
+  background job is run once, pages also with sample keyset cursors both ways.
+
+Literals that are only completed at runtime (a "WHERE 1=1" prefix that filters,
+ORDER BY and LIMIT are appended to, f-strings, str.format templates) are not
+explained as written; instead at least one statement from the second pass must
+match each of them, so a dynamic query nobody exercises fails the check too.
+
+A plan step fails when it reads a whole table: a plain SCAN, or a SCAN USING
+INDEX walk of a whole index (ordered, but still every row) unless the statement
+is bounded by a LIMIT. Statements that cannot be explained fail as well.
+
+Without a database argument a scratch database is built from migrations.py, so the
+check sees exactly the schema and indexes a fresh install would have. When pointed at
+a real database the planner also uses its ANALYZE statistics, so use a copy with
+representative data: on a handful of rows a scan legitimately is the cheapest plan.
+The app itself always runs on its own scratch database, never on the one given.
+"""
+import ast
+import glob
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+from migrations import apply_migrations
+
+# Scripts that talk to their own legacy schema or database, or only run DDL
+SKIP_FILES = {'add.py', 'delete.py', 'database.py', 'migrations.py', 'check_query_plans.py', 'ratelimit.py'}
+
+# Tables that are small by nature (a few dozen rows), or are read in full by design
+# (availability_dirty only holds books changed since the last sync)
+SMALL_TABLES = {'categories', 'schema_version', 'library_stats', 'availability_dirty', 'sqlite_master', 'sqlite_sequence'}
+
+# Queries that must scan by design, matched on a substring of the SQL
+ALLOWED_SCANS = {
+    "SET available = NOT EXISTS": 'full availability reconciliation visits every book by design',
+    "offline index build reads every book": 'catalog_index.py build reads the whole catalog by design',
+    "/* recount */": 'library_stats.py recounts correct counter drift on a timer by design',
+    "/* full export */": 'an unfiltered audit export streams the whole table by design',
+}
+
+# App SQL is written with upper-case keywords, which keeps chat strings like "delete book" out
+SQL_START = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\s')
+# A whole-table read: a plain scan, or a walk of a whole index to get rows in its order
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?$')
+LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+FORMAT_FIELD = re.compile(r'\{\w*\}')
+DYNAMIC_PREFIX = 'WHERE 1=1'
+
+# The library the app runs on in the second pass: big enough for every page to have
+# rows, loans out, late returns and fines
+SAMPLE_DATA = {'loans': 300, 'books': 120, 'categories': 6, 'students': 12}
+
+
+def _compact(sql):
+    # Templates are matched with all whitespace removed, so indentation never matters
+    return re.sub(r'\s+', '', sql)
+
+
+def _template(pieces):
+    """Regex for a statement completed at runtime; ``pieces`` are text, None for a runtime part."""
+    return re.compile(''.join('.+?' if piece is None else re.escape(_compact(piece)) for piece in pieces), re.DOTALL)
+
+
+def collect_queries(directory):
+    """Yield (filename, lineno, sql, template) for every SQL string literal in the app modules.
+
+    ``template`` is None for complete statements, else the regex the composed
+    statements match.
+    """
+    for path in sorted(glob.glob(os.path.join(directory, '*.py'))):
+        # Benchmarks verify their own scratch databases with deliberately exhaustive queries
+        if os.path.basename(path) in SKIP_FILES or os.path.basename(path).startswith('bench_'):
+            continue
+        with open(path, encoding='utf-8') as f:
+            tree = ast.parse(f.read(), path)
+        filename = os.path.basename(path)
+        f_string_parts = set()
+        # ast.walk visits an f-string before the constants inside it
+        for node in ast.walk(tree):
+            if isinstance(node, ast.JoinedStr):
+                f_string_parts.update(id(value) for value in node.values)
+                pieces = [value.value if isinstance(value, ast.Constant) else None for value in node.values]
+                if isinstance(pieces[0], str) and SQL_START.match(pieces[0]):
+                    yield filename, node.lineno, ast.unparse(node), _template(pieces)
+            elif (isinstance(node, ast.Constant) and isinstance(node.value, str) and id(node) not in f_string_parts
+                  and SQL_START.match(node.value)):
+                sql = node.value
+                if FORMAT_FIELD.search(sql):
+                    fields = FORMAT_FIELD.split(sql)
+                    pieces = [piece for text in fields for piece in (text, None)][:-1]
+                    yield filename, node.lineno, sql, _template(pieces)
+                elif DYNAMIC_PREFIX in sql:
+                    yield filename, node.lineno, sql, _template([sql, None])
+                else:
+                    yield filename, node.lineno, sql, None
+
+
+def explain(conn, sql, params=None):
+    if params is None:
+        placeholders = sql.count('?')
+        named = re.findall(r'(?<!:):(\w+)', sql) if not placeholders else []
+        params = dict.fromkeys(named) if named else [None] * placeholders
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def full_scans(conn, sql, params=None):
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    # A partial index only holds the rows its WHERE selects (e.g. pending jobs)
+    partial = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql LIKE '% WHERE %'")}
+    bounded = LIMIT.search(sql)
+    scans = []
+    for detail in explain(conn, sql, params):
+        match = FULL_SCAN.match(detail)
+        if not match:
+            continue
+        # An index walk in key order that stops after LIMIT rows is the keyset page plan
+        if match.group(2) and (bounded or match.group(2) in partial):
+            continue
+        table = match.group(1)
+        # Plans print the alias when one is used; resolve it back to the table name
+        if table not in tables:
+            alias = re.search(r'\b(?:FROM|JOIN)\s+(\w+)\s+(?:AS\s+)?' + re.escape(table) + r'\b', sql, re.IGNORECASE)
+            table = alias.group(1) if alias else table
+        if table not in SMALL_TABLES:
+            scans.append(detail)
+    return scans
+
+
+def exercise_app(workdir):
+    """Run the app on a generated library; returns {normalized sql: (case, sql, params)} of what it executed."""
+    from slow_queries import normalize_sql
+
+    db_path = os.path.join(workdir, 'app.db')
+    index_path = os.path.join(workdir, 'catalog_index')
+    # Before anything imports config, which reads them once
+    os.environ.update(FLASK_CONFIG='benchmark', DATABASE_PATH=db_path, CATALOG_INDEX_PATH=index_path)
+    statements = {}
+    case = ['generate_data.py']
+
+    def record(sql, params):
+        if SQL_START.match(sql):
+            statements.setdefault(normalize_sql(sql), (case[0], sql, params))
+
+    import generate_data
+    from catalog_index import build_index, save_index
+
+    conn = sqlite3.connect(db_path)
+    apply_migrations(conn)
+    conn.execute('PRAGMA journal_mode = WAL')
+    # Traced statements have their parameters inlined
+    conn.set_trace_callback(lambda sql: record(sql, None))
+    with open(os.devnull, 'w') as devnull:
+        generate_data.generate(conn, out=devnull, **SAMPLE_DATA)
+    conn.set_trace_callback(None)
+    conn.row_factory = sqlite3.Row
+    save_index(build_index(conn), index_path)
+    student_id, book_id = conn.execute('SELECT user_id, book_id FROM borrow_log WHERE returned = 1 LIMIT 1').fetchone()
+    free_book = conn.execute('SELECT id FROM books WHERE available = 1 LIMIT 1').fetchone()[0]
+    category_id = conn.execute('SELECT MIN(id) FROM categories').fetchone()[0]
+    conn.close()
+
+    # Upload folders, logs and profiles are created relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import server
+        from flask import url_for
+        from jinja2 import BaseLoader, ChoiceLoader
+
+        from bench_routes import route_cases
+        from exports import EXPORTS
+        from fine_engine import accrue_fines
+        from library_stats import refresh_stats
+        from media import collect_orphans
+        from pagination import encode_cursor
+
+        # The HTML templates are not in this repository; views render an empty page
+        class EmptyTemplates(BaseLoader):
+            def get_source(self, environment, template):
+                return '', None, lambda: True
+
+        server.app.jinja_env.loader = ChoiceLoader([server.app.jinja_env.loader, EmptyTemplates()])
+        server.db_pool.add_statement_hook(lambda conn, sql, params, seconds: record(sql, params))
+        conn = server.get_db_connection()
+        admin_id = conn.execute("SELECT id FROM users WHERE username = 'admin' AND role = 'admin'").fetchone()[0]
+        conn.close()
+        clients = {}
+        for role, user_id in (('admin', admin_id), ('student', student_id)):
+            clients[role] = server.app.test_client()
+            with clients[role].session_transaction() as session:
+                session.update(logged_in=True, role=role, user_id=user_id, username=role)
+
+        # Every keyset in the app sorts on two columns; the other arities check that a
+        # malformed cursor falls back to the first page
+        cursors = [encode_cursor(['m', 1, 1][:arity], direction, 2)
+                   for arity in (1, 2, 3) for direction in ('next', 'prev')]
+        # Media files are served from disk without queries (and resolved against the app's
+        # folder, not this scratch directory)
+        cases = [(name, role, method, url, body) for name, role, method, url, body
+                 in route_cases(server, book_id, student_id) if not url.startswith('/media/')]
+        with server.app.test_request_context():
+            for search in ('', 'history'):
+                for category in ('', category_id):
+                    for availability in ('', 'available', 'borrowed'):
+                        url = url_for('browse_books', search=search, category=category, availability=availability)
+                        cases.append((f'GET {url}', 'student', 'GET', url, None))
+            for name in EXPORTS:
+                for filters in ({}, {'user_id': student_id}, {'start': '2020-01-01'}, {'end': '2030-01-01'},
+                                {'start': '2020-01-01', 'end': '2030-01-01', 'user_id': student_id}):
+                    url = url_for('admin_export', name=name, fmt='csv', **filters)
+                    cases.append((f'GET {url}', 'admin', 'GET', url, None))
+            cases += [
+                ('borrow', 'student', 'GET', url_for('borrow_book_route', book_id=free_book), None),
+                ('return', 'student', 'GET', url_for('return_book_route', book_id=free_book), None),
+            ]
+        for name, role, method, url, body in list(cases):
+            if method == 'GET' and not url.startswith(('/admin/export', '/borrow', '/return')):
+                separator = '&' if '?' in url else '?'
+                cases += [(f'{name} cursor', role, method, f'{url}{separator}cursor={cursor}', None)
+                          for cursor in cursors]
+
+        for name, role, method, url, body in cases:
+            case[0] = name
+            response = clients[role].open(url, method=method, json=body)
+            response.get_data()
+            response.close()
+        with server.app.test_request_context():
+            for name in server.CHAT_LISTINGS:
+                for cursor in [None] + cursors:
+                    for query in ('history', ''):
+                        case[0] = f'chat listing {name}'
+                        list(server.show_listing(name, student_id, {'query': query}, cursor))
+
+        jobs = {
+            'fine accrual': lambda conn: accrue_fines(conn, server.app.config['FINE_PER_DAY']),
+            'statistics refresh': refresh_stats,
+            'media cleanup': lambda conn: collect_orphans(conn, server.image_pipeline.folders),
+        }
+        for name, job in jobs.items():
+            case[0] = name
+            conn = server.get_db_connection()
+            job(conn)
+            conn.close()
+        for incremental in (True, False):
+            case[0] = 'availability sync'
+            server.sync_availability_with_borrow_log(incremental=incremental)
+    finally:
+        os.chdir(cwd)
+    return statements
+
+
+def check(db_path, directory, workdir):
+    conn = sqlite3.connect(db_path)
+    failures = 0
+    checked = 0
+
+    def report(where, sql, params=None):
+        nonlocal failures, checked
+        checked += 1
+        try:
+            scans = full_scans(conn, sql, params)
+        except sqlite3.Error as e:
+            failures += 1
+            print(f"❌ {where}: could not explain query: {e}")
+            print('    ' + ' '.join(sql.split()))
+            return
+        if not scans:
+            return
+        allowed = [reason for needle, reason in ALLOWED_SCANS.items() if needle in sql]
+        if allowed:
+            print(f"ℹ️  {where}: full scan allowed ({allowed[0]})")
+            return
+        failures += 1
+        print(f"❌ {where}: full table scan: {'; '.join(scans)}")
+        print('    ' + ' '.join(sql.split()))
+
+    templates = []
+    for filename, lineno, sql, template in collect_queries(directory):
+        if template is None:
+            report(f'{filename}:{lineno}', sql)
+        else:
+            templates.append((filename, lineno, sql, template))
+    in_source = checked
+
+    statements = exercise_app(workdir)
+    for case, sql, params in statements.values():
+        report(f'as run ({case})', sql, params)
+    composed = [_compact(sql) for _, sql, _ in statements.values()]
+    for filename, lineno, sql, template in templates:
+        if not any(template.fullmatch(statement) for statement in composed):
+            failures += 1
+            print(f"❌ {filename}:{lineno}: completed at runtime, but the app never ran it: "
+                  f"{' '.join(sql.split())[:100]}")
+    conn.close()
+    print(f"Checked {in_source} queries in the source and {checked - in_source} as run by the app "
+          f"({len(templates)} runtime templates), {failures} problems.")
+    return failures
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as tmp:
+        if len(sys.argv) > 1:
+            db_path = os.path.abspath(sys.argv[1])
+        else:
+            db_path = os.path.join(tmp, 'plans.db')
+            conn = sqlite3.connect(db_path)
+            apply_migrations(conn)
+            conn.close()
+        failures = check(db_path, here, tmp)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,136 @@
+import re
+import time
+
+# Grammar tokens, separated by spaces:
+#   word            literal keyword (matched case-insensitively)
+#   [word]          optional literal keyword
+#   <name>          one word, passed as str
+#   <name:int>      integer, passed as int
+#   <name:text>     free text up to the next literal (or end of line), passed as str
+#   key:<name:...>  literal prefix glued to a parameter, e.g. title:<title:text>
+_PARAM = re.compile(r'<(\w+)(?::(\w+))?>')
+_PATTERNS = {
+    'str': r'\S+',
+    'int': r'[+-]?\d+',
+    'text': r'.+?',
+}
+_CONVERTERS = {
+    'str': str,
+    'int': int,
+    'text': str.strip,
+}
+
+
+class Command:
+    def __init__(self, grammar, handler, usage=None, help=None):
+        self.grammar = grammar
+        self.handler = handler
+        self.usage = usage or grammar
+        self.help = help
+        self.converters = {}
+        self.regex = re.compile(self._compile(grammar), re.IGNORECASE | re.DOTALL)
+        self.keyword = grammar.split()[0].lower()
+        # Literal words of the grammar, e.g. 'list available books': a stable label for metrics
+        self.name = ' '.join(token.strip('[]').lower() for token in grammar.split() if '<' not in token)
+
+    def _compile(self, grammar):
+        parts = []
+        for token in grammar.split():
+            optional = token.startswith('[') and token.endswith(']')
+            if optional:
+                token = token[1:-1]
+            pattern = ''
+            pos = 0
+            for match in _PARAM.finditer(token):
+                pattern += re.escape(token[pos:match.start()])
+                name, kind = match.group(1), match.group(2) or 'str'
+                self.converters[name] = _CONVERTERS[kind]
+                pattern += f'\\s*(?P<{name}>{_PATTERNS[kind]})'
+                pos = match.end()
+            pattern += re.escape(token[pos:])
+            parts.append(f'(?:\\s+{pattern})?' if optional else f'\\s+{pattern}')
+        # The keyword starts the line, so it needs no leading separator
+        return parts[0][len('\\s+'):] + ''.join(parts[1:])
+
+    def parse(self, text):
+        match = self.regex.fullmatch(text)
+        if not match:
+            return None
+        return {name: self.converters[name](value)
+                for name, value in match.groupdict().items() if value is not None}
+
+
+class CommandRegistry:
+    """Chat commands declared once by grammar and dispatched by their first keyword.
+
+    Commands are bucketed by keyword in a dict, so dispatch costs one hash lookup
+    plus a precompiled regex match against the (usually one or two) commands that
+    share the keyword, no matter how many commands are registered.
+    """
+
+    def __init__(self):
+        self._by_keyword = {}
+        self._commands = []
+        # observer(command name, seconds) after every dispatch; 'fallback' for text
+        # handed to the fallback, 'unknown' when nothing answered
+        self.observers = []
+
+    def command(self, grammar, usage=None, help=None):
+        # ``usage`` is shown when the keyword matches but the arguments don't;
+        # ``help`` is the line listed by help_lines(), omitted when None
+        def decorator(handler):
+            command = Command(grammar, handler, usage, help)
+            self._by_keyword.setdefault(command.keyword, []).append(command)
+            self._commands.append(command)
+            return handler
+        return decorator
+
+    def help_lines(self):
+        return [command.help for command in self._commands if command.help]
+
+    def match(self, text):
+        """Parse without running: (command, args), (None, candidates) when only the
+        keyword matched, or (None, None) for an unknown keyword."""
+        text = text.strip()
+        if not text:
+            return None, None
+        candidates = self._by_keyword.get(text.split(None, 1)[0].lower())
+        if not candidates:
+            return None, None
+        for command in candidates:
+            args = command.parse(text)
+            if args is not None:
+                return command, args
+        return None, candidates
+
+    def dispatch(self, text, fallback=None, **context):
+        """Run the matching command; returns its reply, or None if no keyword matched.
+
+        Text that is not a command goes to ``fallback(text, **context)`` when given.
+        A known keyword whose arguments do not fit any grammar (and that the fallback
+        could not handle) returns that command's usage line instead of None.
+        """
+        started = time.perf_counter()
+        command, args = self.match(text)
+        if command is not None:
+            name = command.name
+            try:
+                return command.handler(**context, **args)
+            finally:
+                self._observe(name, started)
+        reply = fallback(text, **context) if fallback else None
+        name = 'fallback' if reply is not None else 'unknown'
+        if reply is None and args:
+            name = args[0].name
+            reply = f"❌ Format: {args[0].usage}"
+        self._observe(name, started)
+        return reply
+
+    def _observe(self, name, started):
+        if self.observers:
+            elapsed = time.perf_counter() - started
+            for observer in self.observers:
+                observer(name, elapsed)
+
+    def __len__(self):
+        return len(self._commands)
@@ -1,72 +1,205 @@
-import os
-from datetime import timedelta
-
-class Config:
-    # Basic Flask config
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-    
-    # Database config
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///books.db'
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
-    
-    # Security config
-    SESSION_COOKIE_SECURE = True
-    SESSION_COOKIE_HTTPONLY = True
-    SESSION_COOKIE_SAMESITE = 'Lax'
-    PERMANENT_SESSION_LIFETIME = timedelta(days=1)
-    
-    # Email config
-    MAIL_SERVER = os.environ.get('MAIL_SERVER')
-    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
-    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') is not None
-    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
-    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
-    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
-    
-    # Fine calculation
-    FINE_PER_DAY = 1.00  # $1 per day
-    
-    # Book settings
-    MAX_BOOKS_PER_USER = 5
-    LOAN_PERIOD_DAYS = 14
-    
-    # Rate limiting
-    RATELIMIT_DEFAULT = "200 per day;50 per hour"
-    RATELIMIT_STORAGE_URL = "memory://"
-
-class DevelopmentConfig(Config):
-    DEBUG = True
-    SESSION_COOKIE_SECURE = False
-
-class ProductionConfig(Config):
-    DEBUG = False
-    
-    @classmethod
-    def init_app(cls, app):
-        # Production-specific initialization
-        import logging
-        from logging.handlers import RotatingFileHandler
-        
-        # Set up logging
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/library.log', maxBytes=10240, backupCount=10)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-        ))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
-        app.logger.setLevel(logging.INFO)
-        app.logger.info('Library startup')
-
-class TestingConfig(Config):
-    TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
-    WTF_CSRF_ENABLED = False
-
-config = {
-    'development': DevelopmentConfig,
-    'production': ProductionConfig,
-    'testing': TestingConfig,
-    'default': DevelopmentConfig
+import logging
+import os
+from datetime import timedelta
+from logging.handlers import RotatingFileHandler
+
+def rotating_file_handler(path, max_bytes, backup_count, fmt):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    handler.setFormatter(logging.Formatter(fmt))
+    return handler
+
+def threshold_or_off(value, default):
+    # Unset or empty means the default; 'off' or 0 gives None, which turns the feature off
+    if value is None or not value.strip():
+        return default
+    if value.strip().lower() == 'off':
+        return None
+    return float(value) or None
+
+class Config:
+    # Basic Flask config
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+    
+    # Database config
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///books.db'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DATABASE_PATH = os.environ.get('DATABASE_PATH') or 'books.db'
+    
+    # SQLite connection pool
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 8)  # idle connections kept per worker
+    DB_POOL_PING_INTERVAL = 30  # seconds idle before a pooled connection is health-checked
+    DB_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,  # ms
+        'cache_size': -16000,  # negative = KiB, so ~16 MB per connection
+        'mmap_size': 134217728,  # 128 MB
+        'temp_store': 'MEMORY',
+    }
+    # Borrow/return transactions still locked after busy_timeout are retried this many
+    # times in total, pausing backoff * 2**attempt seconds (jittered) in between
+    DB_WRITE_ATTEMPTS = 5
+    DB_WRITE_BACKOFF = 0.02
+    
+    # Security config
+    SESSION_COOKIE_SECURE = True
+    SESSION_COOKIE_HTTPONLY = True
+    SESSION_COOKIE_SAMESITE = 'Lax'
+    PERMANENT_SESSION_LIFETIME = timedelta(days=1)
+    
+    # Email config
+    MAIL_SERVER = os.environ.get('MAIL_SERVER')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT') or 587)
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') is not None
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
+    
+    # Fine calculation
+    FINE_PER_DAY = 1.00  # $1 per day
+    FINE_ACCRUAL_INTERVAL = 3600  # seconds; the batch is idempotent, so re-runs only catch up
+    
+    # Book settings
+    MAX_BOOKS_PER_USER = 5
+    LOAN_PERIOD_DAYS = 14
+    
+    # Student dashboard: recent items shown before "load more", cached users per worker
+    DASHBOARD_HISTORY_LIMIT = 10
+    DASHBOARD_CACHE_SIZE = 1024
+    
+    # Statistics counters drift correction (seconds)
+    STATS_REFRESH_INTERVAL = 300
+    
+    # Free-form chat: intent model built by intents.py, minimum cosine similarity to act on
+    INTENT_MODEL_PATH = os.environ.get('INTENT_MODEL_PATH') or 'intent_model.npz'
+    INTENT_MIN_SCORE = 0.2
+    
+    # Semantic catalog search: index directory built by catalog_index.py, results per query
+    CATALOG_INDEX_PATH = os.environ.get('CATALOG_INDEX_PATH') or 'catalog_index'
+    SEMANTIC_SEARCH_LIMIT = 10
+    
+    # Chat listings (list books, search, ...): rows per reply before "more"
+    CHAT_PAGE_SIZE = 50
+    
+    # Worker processes resizing uploaded profile pictures and covers
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS') or 2)
+    
+    # Uploaded images: hand files to the front-end server (None, 'x-sendfile' or
+    # 'x-accel-redirect'), and sweep files no row uses after a grace period (seconds)
+    MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE') or None
+    # Reverse proxies in front of the app whose X-Forwarded-For is trusted (1 behind a
+    # single nginx). 0 trusts none: right for direct access, but behind a proxy every
+    # client then shares the proxy's address and its per-IP rate limits
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR') or 0)
+    MEDIA_ACCEL_PREFIX = '/protected-media/'
+    MEDIA_GC_INTERVAL = 3600
+    MEDIA_GC_GRACE = 3600
+    
+    # Cached chat replies and read-only helpers per worker; entries are also dropped on
+    # any catalog/user data version change, the TTL (seconds) only ages out cold entries
+    RESPONSE_CACHE_SIZE = 2048
+    RESPONSE_CACHE_TTL = 300
+    
+    # Logged-in users' rows (g.current_user) per worker; edits made through this worker
+    # drop the entry at once, the TTL (seconds) bounds how long other workers lag
+    USER_CACHE_SIZE = 4096
+    USER_CACHE_TTL = 30
+    
+    # Slow-query log (slow_queries.py): statements slower than this many seconds are
+    # logged with their query plan, one JSON object per line. None turns it off, as does
+    # SLOW_QUERY_THRESHOLD=off (or 0) in the environment; unset or empty means 0.1
+    SLOW_QUERY_THRESHOLD = threshold_or_off(os.environ.get('SLOW_QUERY_THRESHOLD'), 0.1)
+    SLOW_QUERY_LOG = 'logs/slow_queries.log'
+    SLOW_QUERY_LOG_MAX_BYTES = 1048576
+    SLOW_QUERY_LOG_BACKUPS = 5
+    
+    # Request profiler (profiler.py): admins add "X-Profile: 1" or ?profile=1 to a
+    # request; its sampled stacks are kept in PROFILE_DIR (newest PROFILE_KEEP files)
+    PROFILE_DIR = 'profiles'
+    PROFILE_INTERVAL = 0.005  # seconds between stack samples
+    PROFILE_KEEP = 100
+    
+    # /admin/metrics: Prometheus scrapes with "Authorization: Bearer <METRICS_TOKEN>"
+    # (admins can open it while logged in); no token means admin sessions only
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # Audit exports (/admin/export/...): rows fetched from the cursor per response chunk
+    EXPORT_CHUNK_SIZE = 1000
+    
+    # Pagination
+    PAGE_SIZE = 25
+    MAX_PAGE_SIZE = 100
+    
+    # Rate limiting (ratelimit.py): "N per minute|hour|day" rules separated by ';'.
+    # LOGIN_IP applies per client IP to the login forms and LOGIN per username tried,
+    # both counting failed logins only; the IP budget is large enough for a computer
+    # lab or campus NAT full of students mistyping. CHAT per logged-in user and CHAT_IP
+    # per client IP apply to /chat and /chat/stream.
+    # memory:// counts in each worker, sqlite:///path shares the counts between them
+    RATELIMIT_ENABLED = True
+    RATELIMIT_LOGIN_IP = "100 per 10 minutes;300 per hour"
+    RATELIMIT_LOGIN = "10 per minute"
+    RATELIMIT_CHAT = "30 per minute;600 per hour"
+    RATELIMIT_CHAT_IP = "120 per minute"
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL') or "memory://"
+    
+    @classmethod
+    def init_app(cls, app):
+        if cls.SLOW_QUERY_THRESHOLD is not None:
+            logger = logging.getLogger('library.slow_queries')
+            if not logger.handlers:
+                logger.addHandler(rotating_file_handler(cls.SLOW_QUERY_LOG, cls.SLOW_QUERY_LOG_MAX_BYTES,
+                                                        cls.SLOW_QUERY_LOG_BACKUPS, '%(message)s'))
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    SESSION_COOKIE_SECURE = False
+
+class ProductionConfig(Config):
+    DEBUG = False
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 16)
+    DB_PRAGMAS = dict(Config.DB_PRAGMAS, cache_size=-65536, mmap_size=536870912)
+    # gunicorn workers do not share memory
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL') or 'sqlite:///ratelimit.db'
+    
+    @classmethod
+    def init_app(cls, app):
+        # Production-specific initialization
+        super().init_app(app)
+        
+        # Set up logging
+        file_handler = rotating_file_handler('logs/library.log', 10240, 10,
+                                             '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        file_handler.setLevel(logging.INFO)
+        app.logger.addHandler(file_handler)
+        app.logger.setLevel(logging.INFO)
+        app.logger.info('Library startup')
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    DATABASE_PATH = 'file:testing?mode=memory&cache=shared'
+    DB_PRAGMAS = dict(Config.DB_PRAGMAS, journal_mode='MEMORY', mmap_size=0)
+    WTF_CSRF_ENABLED = False
+    SLOW_QUERY_THRESHOLD = None
+    # Tests and bench_chat_dispatch.py send far more requests than any limit allows
+    RATELIMIT_ENABLED = False
+
+class BenchmarkConfig(ProductionConfig):
+    # bench_routes.py: production tuning on a generated DATABASE_PATH, without the
+    # background jobs (TESTING) so they do not run in the middle of a measurement
+    TESTING = True
+    SESSION_COOKIE_SECURE = False
+    # Every chat case is sent dozens of times by the same student
+    RATELIMIT_ENABLED = False
+
+config = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+    'benchmark': BenchmarkConfig,
+    'default': DevelopmentConfig
 } 
\ No newline at end of file
@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+# Statements are module constants so sqlite3's per-connection statement cache
+# (kept warm by the pool) prepares each of them once per connection.
+VERSION_SQL = 'SELECT version FROM user_data_version WHERE user_id = ?'
+# Fines are the amounts accrued by fine_engine.py, not recomputed here
+BORROWED_SQL = '''
+    SELECT bl.id as borrow_id, bl.book_id, bl.issue_date, bl.due_date, bl.returned, b.title, b.author,
+           COALESCE(f.amount, 0) as fine
+    FROM borrow_log bl
+    JOIN books b ON bl.book_id = b.id
+    LEFT JOIN fines f ON f.borrow_id = bl.id
+    WHERE bl.user_id = ? AND bl.returned = 0
+'''
+HISTORY_SQL = '''
+    SELECT rh.id as history_id, rh.user_id, rh.book_id, rh.borrow_date, rh.return_date,
+           b.title as book_title, b.author as book_author
+    FROM reading_history rh
+    JOIN books b ON rh.book_id = b.id
+    WHERE rh.user_id = ?
+    ORDER BY rh.borrow_date DESC, rh.id DESC
+    LIMIT ?
+'''
+FINES_SQL = '''
+    SELECT f.id as fine_id, f.user_id, f.amount, f.reason, f.paid, f.created_at, f.paid_at
+    FROM fines f
+    WHERE f.user_id = ?
+    ORDER BY f.created_at DESC
+    LIMIT ?
+'''
+
+
+def _data_version(conn, user_id):
+    row = conn.execute(VERSION_SQL, (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def load_dashboard(conn, user_id, history_limit=10, fines_limit=10):
+    """The student's loans, history and fines for the dashboard, read from one snapshot.
+
+    All statements run inside a single read transaction, so the open loans,
+    history and fines are mutually consistent even while other requests write
+    (the user row itself is g.current_user, see user_cache.py). History and
+    fines are capped at the most recent N rows; the ``*_has_more`` flags tell the
+    page to link to the full, paginated lists.
+    """
+    conn.execute('BEGIN')
+    try:
+        version = _data_version(conn, user_id)
+        borrowed_rows = conn.execute(BORROWED_SQL, (user_id,)).fetchall()
+        # One extra row tells us whether there is more to load
+        history_rows = conn.execute(HISTORY_SQL, (user_id, history_limit + 1)).fetchall()
+        fine_rows = conn.execute(FINES_SQL, (user_id, fines_limit + 1)).fetchall()
+    finally:
+        conn.commit()
+
+    # Dates arrive as date/datetime objects from the driver (row_types.py)
+
+    return {
+        'version': version,
+        'loaded_on': datetime.now().date(),
+        'borrowed_books': borrowed_rows,
+        'reading_history': history_rows[:history_limit],
+        'history_has_more': len(history_rows) > history_limit,
+        'fine_history': fine_rows[:fines_limit],
+        'fines_has_more': len(fine_rows) > fines_limit,
+    }
+
+
+class DashboardCache:
+    """Per-worker LRU of dashboard data keyed by the user's data version.
+
+    A hit costs one primary-key lookup of user_data_version. Any borrow, return,
+    history or fine change for the user bumps that version (triggers from
+    migration 6), so the next request reloads, in every worker, with no explicit
+    invalidation calls needed.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conn, user_id, **limits):
+        version = _data_version(conn, user_id)
+        key = (user_id, tuple(sorted(limits.items())))
+        with self._lock:
+            entry = self._entries.get(key)
+            # Overdue fines are re-accrued daily, so an entry also expires at midnight
+            if entry is not None and entry['version'] == version and entry['loaded_on'] == datetime.now().date():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        self.misses += 1
+        data = load_dashboard(conn, user_id, **limits)
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
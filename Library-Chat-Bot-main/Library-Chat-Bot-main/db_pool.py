@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import threading
+import time
+
+from row_types import register_types
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool.
+
+    Existing call sites keep doing ``conn = get_db_connection() ... conn.close()``;
+    the pool decides whether the connection is kept warm or really closed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.checked_out = False
+        self.last_used = time.monotonic()
+
+    def execute(self, sql, parameters=()):
+        hooks = self.pool._statement_hooks if self.pool is not None else None
+        if not hooks:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            for hook in hooks:
+                hook(self, sql, parameters, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        hooks = self.pool._statement_hooks if self.pool is not None else None
+        if not hooks:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            for hook in hooks:
+                hook(self, sql, None, elapsed)
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        elif self.checked_out:
+            self.pool.release(self)
+        # else: already back in the pool, a second close() is a no-op
+
+    def really_close(self):
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """Per-worker pool of tuned SQLite connections.
+
+    Idle connections are kept on a LIFO stack so the most recently used (and
+    therefore warmest page cache) is handed out first. The pool never blocks:
+    when more than ``size`` connections are checked out at once the extra ones
+    are closed on release instead of being kept.
+    """
+
+    def __init__(self, path, size=8, pragmas=None, ping_interval=30):
+        self.path = path
+        self.size = size
+        self.pragmas = pragmas or {}
+        self.ping_interval = ping_interval
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._wal_checked = False
+        self._connect_hooks = []
+        self._trace_hooks = []
+        self._statement_hooks = []
+        register_types()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config['DATABASE_PATH'],
+                   size=config['DB_POOL_SIZE'],
+                   pragmas=config['DB_PRAGMAS'],
+                   ping_interval=config['DB_POOL_PING_INTERVAL'])
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, factory=PooledConnection,
+                               check_same_thread=False,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               uri=self.path.startswith('file:'))
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            # journal_mode is persistent in the database file, only set it once
+            if name == 'journal_mode' and self._wal_checked:
+                continue
+            conn.execute(f'PRAGMA {name} = {value}')
+        self._wal_checked = True
+        for hook in self._connect_hooks:
+            hook(conn)
+        conn.pool = self
+        conn.checked_out = True
+        return conn
+
+    def add_connect_hook(self, hook):
+        """Call ``hook(conn)`` for every connection: the idle ones now, new ones as they open.
+
+        Connections checked out at the time are not seen, so add hooks before serving
+        (e.g. to install a trace callback).
+        """
+        with self._lock:
+            self._connect_hooks.append(hook)
+            idle = list(self._idle)
+        for conn in idle:
+            hook(conn)
+
+    def add_trace_hook(self, hook):
+        """Call ``hook(sql)`` for every statement SQLite runs on a pooled connection.
+
+        Uses the connection's trace callback, so it sees every statement whichever
+        way it was issued (cursors, commit(), statements run by triggers, which
+        SQLite reports as "-- TRIGGER ..." comments), with parameters inlined.
+        """
+        self._trace_hooks.append(hook)
+        if len(self._trace_hooks) == 1:
+            self.add_connect_hook(lambda conn: conn.set_trace_callback(self._trace))
+
+    def _trace(self, sql):
+        for hook in self._trace_hooks:
+            hook(sql)
+
+    def add_statement_hook(self, hook):
+        """Call ``hook(conn, sql, parameters, seconds)`` after each conn.execute()/executemany().
+
+        ``seconds`` covers preparing the statement and stepping to its first row,
+        which for sorts and aggregates is nearly all of the work; rows fetched
+        later are not included. executemany() passes None as the parameters.
+        """
+        self._statement_hooks.append(hook)
+
+    def _check_fork(self):
+        # Connections must not cross a fork (gunicorn preload), start over in the child
+        if os.getpid() != self._pid:
+            self._idle = []
+            self._lock = threading.Lock()
+            self._pid = os.getpid()
+
+    def _healthy(self, conn):
+        if time.monotonic() - conn.last_used < self.ping_interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        self._check_fork()
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                return self._connect()
+            if self._healthy(conn):
+                conn.checked_out = True
+                return conn
+            conn.really_close()
+
+    def release(self, conn):
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                # Same semantics as closing a plain connection: uncommitted work is dropped
+                conn.rollback()
+            conn.row_factory = sqlite3.Row
+        except sqlite3.Error:
+            conn.really_close()
+            return
+        conn.last_used = time.monotonic()
+        with self._lock:
+            if os.getpid() == self._pid and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+        conn.really_close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.really_close()
+
+    def stats(self):
+        return {'idle': len(self._idle), 'size': self.size}
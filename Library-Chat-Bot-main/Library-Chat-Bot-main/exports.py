@@ -0,0 +1,179 @@
+"""Streaming CSV/JSONL exports of loans, reading history and fines for auditors.
+
+Usage: python exports.py {borrow_log,reading_history,fines} [--format csv|jsonl]
+                         [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--user-id N]
+                         [--database books.db] [--output FILE]
+
+Rows come off one SQLite cursor with fetchmany() in index order (the date column,
+then id) and are written out a chunk at a time, so an export of ten million loans
+uses the same memory as one of ten. The server streams the same generator as a
+chunked HTTP response (/admin/export/<name>.<format>).
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from contextlib import closing
+from datetime import date, timedelta
+
+# name -> query (filters and ORDER BY are appended), the date and user columns to
+# filter on, and an order each has an index for (migrations 2 and 13)
+EXPORTS = {
+    'borrow_log': {
+        'sql': '''
+            SELECT bl.id, bl.user_id, u.username, u.email, bl.book_id, b.title, b.author, b.isbn,
+                   bl.issue_date, bl.due_date, bl.returned, bl.return_date
+            FROM borrow_log bl
+            LEFT JOIN books b ON b.id = bl.book_id
+            LEFT JOIN users u ON u.id = bl.user_id
+            WHERE 1=1
+        ''',
+        'date': 'bl.issue_date',
+        'user': 'bl.user_id',
+        'order': 'bl.issue_date, bl.id',
+    },
+    'reading_history': {
+        'sql': '''
+            SELECT rh.id, rh.user_id, u.username, u.email, rh.book_id, b.title, b.author, b.isbn,
+                   rh.borrow_date, rh.return_date
+            FROM reading_history rh
+            LEFT JOIN books b ON b.id = rh.book_id
+            LEFT JOIN users u ON u.id = rh.user_id
+            WHERE 1=1
+        ''',
+        'date': 'rh.borrow_date',
+        'user': 'rh.user_id',
+        'order': 'rh.borrow_date, rh.id',
+    },
+    'fines': {
+        'sql': '''
+            SELECT f.id, f.user_id, u.username, u.email, f.amount, f.reason, f.paid, f.created_at, f.paid_at,
+                   f.borrow_id, bl.book_id, b.title
+            FROM fines f
+            LEFT JOIN users u ON u.id = f.user_id
+            LEFT JOIN borrow_log bl ON bl.id = f.borrow_id
+            LEFT JOIN books b ON b.id = bl.book_id
+            WHERE 1=1
+        ''',
+        'date': 'f.created_at',
+        'user': 'f.user_id',
+        'order': 'f.created_at, f.id',
+    },
+}
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+def parse_filters(start=None, end=None, user_id=None):
+    """Validate filter strings (e.g. from a query string); raises ValueError with a readable message."""
+    try:
+        start = date.fromisoformat(start) if start else None
+        end = date.fromisoformat(end) if end else None
+    except ValueError:
+        raise ValueError('Dates must be given as YYYY-MM-DD.')
+    if user_id not in (None, ''):
+        try:
+            user_id = int(user_id)
+        except ValueError:
+            raise ValueError('user_id must be a number.')
+    else:
+        user_id = None
+    return {'start': start, 'end': end, 'user_id': user_id}
+
+
+def export_query(name, start=None, end=None, user_id=None):
+    """SQL and parameters for one export; ``end`` is inclusive."""
+    spec = EXPORTS[name]
+    sql, params = spec['sql'], []
+    if user_id is not None:
+        sql += f" AND {spec['user']} = ?"
+        params.append(user_id)
+    # Dates are stored as ISO text, so plain string ranges work for DATE and TIMESTAMP columns
+    if start:
+        sql += f" AND {spec['date']} >= ?"
+        params.append(start.isoformat())
+    if end:
+        sql += f" AND {spec['date']} < ?"
+        params.append((end + timedelta(days=1)).isoformat())
+    sql += f" ORDER BY {spec['order']}"
+    if not params:
+        # The unfiltered export reads the whole table in index order by design;
+        # check_query_plans.py allows exactly this statement by the marker
+        sql += ' /* full export */'
+    return sql, params
+
+
+def export_rows(conn, name, chunk_size=1000, **filters):
+    """Yield the column names, then lists of row tuples of up to ``chunk_size`` rows."""
+    sql, params = export_query(name, **filters)
+    cursor = conn.execute(sql, params)
+    try:
+        yield [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def stream_export(conn, name, fmt='csv', chunk_size=1000, **filters):
+    """Yield the export as text chunks, one per fetchmany() batch."""
+    # Dates and timestamps come back as Python objects; str() gives their stored ISO form
+    with closing(export_rows(conn, name, chunk_size, **filters)) as chunks:
+        columns = next(chunks)
+        buffer = io.StringIO()
+        if fmt == 'csv':
+            writer = csv.writer(buffer, lineterminator='\n')
+            writer.writerow(columns)
+            for rows in chunks:
+                writer.writerows(rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()  # header only, when there are no rows
+        else:
+            for rows in chunks:
+                yield ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in rows)
+
+
+def export_filename(name, fmt, filters):
+    parts = [name]
+    if filters.get('user_id') is not None:
+        parts.append(f"user{filters['user_id']}")
+    if filters.get('start') or filters.get('end'):
+        parts.append(f"{filters.get('start') or 'start'}_{filters.get('end') or date.today()}")
+    return '-'.join(str(part) for part in parts) + '.' + fmt
+
+
+if __name__ == '__main__':
+    import sqlite3
+    from row_types import register_types
+
+    parser = argparse.ArgumentParser(description='Export loans, reading history or fines.')
+    parser.add_argument('name', choices=sorted(EXPORTS))
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--start', help='first date to include, YYYY-MM-DD')
+    parser.add_argument('--end', help='last date to include, YYYY-MM-DD')
+    parser.add_argument('--user-id')
+    parser.add_argument('--database', default='books.db')
+    parser.add_argument('--output', help='default: standard output')
+    args = parser.parse_args()
+    try:
+        filters = parse_filters(args.start, args.end, args.user_id)
+    except ValueError as e:
+        parser.error(str(e))
+
+    register_types()
+    conn = sqlite3.connect(args.database, detect_types=sqlite3.PARSE_DECLTYPES)
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        with closing(stream_export(conn, args.name, args.format, **filters)) as chunks:
+            for chunk in chunks:
+                out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+        conn.close()
@@ -0,0 +1,65 @@
+# Overdue fines are computed in SQL and stored in `fines`, one row per late loan
+# (fines.borrow_id, unique). Pages read the stored amount instead of recomputing
+# it per row on every request.
+#
+# Days overdue = julianday(end) - julianday(due_date), where end is the return date
+# for returned loans and today otherwise. Both statements are upserts, so running
+# them again the same day changes nothing and a missed day is caught up by the
+# next run. Paid fines are never touched.
+
+_UPSERT = '''
+    INSERT INTO fines (user_id, borrow_id, amount, reason, paid)
+    SELECT bl.user_id, bl.id,
+           ROUND(CAST(julianday(COALESCE(CASE WHEN bl.returned THEN bl.return_date END, :today))
+                      - julianday(bl.due_date) AS INTEGER) * :rate, 2),
+           'Overdue: ' || COALESCE(b.title, 'book #' || bl.book_id),
+           0
+    FROM borrow_log bl
+    LEFT JOIN books b ON b.id = bl.book_id
+    WHERE {where}
+    ON CONFLICT (borrow_id) WHERE borrow_id IS NOT NULL DO UPDATE
+    SET amount = excluded.amount
+    WHERE fines.paid = 0 AND fines.amount IS NOT excluded.amount
+'''
+
+# Every open loan past its due date (served by the partial idx_borrow_log_overdue)
+ACCRUE_SQL = _UPSERT.format(where='bl.returned = 0 AND bl.due_date < :today')
+
+# One loan at return time: fixes the amount at the days actually overdue
+FINALIZE_SQL = _UPSERT.format(where='bl.id = :borrow_id AND bl.returned = 1 AND bl.return_date > bl.due_date')
+
+
+def accrue_fines(conn, rate, today=None):
+    """Daily batch: bring every overdue loan's fine up to date in one transaction.
+
+    Returns the number of fine rows inserted or changed.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        changed = conn.execute(ACCRUE_SQL, {'rate': rate, 'today': _today(conn, today)}).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return changed
+
+
+def finalize_fine(conn, borrow_id, rate):
+    """Settle the fine for a just-returned loan; runs inside the caller's transaction."""
+    return conn.execute(FINALIZE_SQL, {'rate': rate, 'borrow_id': borrow_id, 'today': None}).rowcount
+
+
+def _today(conn, today):
+    if today is None:
+        return conn.execute('SELECT CURRENT_DATE').fetchone()[0]
+    return today.isoformat() if hasattr(today, 'isoformat') else today
+
+
+if __name__ == '__main__':
+    # Can also be run from cron: python fine_engine.py [database]
+    import sqlite3
+    import sys
+    from config import Config
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else 'books.db')
+    print(f"Fines accrued or updated: {accrue_fines(conn, Config.FINE_PER_DAY)}")
+    conn.close()
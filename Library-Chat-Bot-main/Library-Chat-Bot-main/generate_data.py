@@ -0,0 +1,326 @@
+"""Fill a database with a synthetic library: categories, books, students, loans,
+reading history and fines.
+
+Usage: python generate_data.py [--scale 1k|100k|10m] [--database books.db]
+                               [--books N] [--categories N] [--students N] [--loans N]
+                               [--days 730] [--late-ratio 0.12] [--lost-ratio 0.005]
+                               [--paid-ratio 0.7] [--seed 42] [--append]
+
+A scale names the size of borrow_log; the other tables are sized to match (see
+SCALES), and any explicit count overrides its preset. The same seed always
+produces the same rows, so benchmark baselines stay comparable.
+
+Loans are spread over the last --days days in issue order. A --late-ratio share
+are returned after their due date and get a fine (a --paid-ratio share of those
+paid); a --lost-ratio share are never returned. Loans still out today stay open,
+at most one per book, and books.available matches them; overdue open loans get
+their fines from fine_engine.accrue_fines(). Every loan has its reading_history
+row.
+
+Everything is written in one transaction with the maintenance triggers dropped;
+they are recreated before the commit, and the derived data they keep (full-text
+index, catalog_changes, statistics counters) is rebuilt afterwards. A database
+that already has books is refused unless --append is given.
+"""
+import argparse
+import json
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from config import Config
+from fine_engine import accrue_fines
+from library_stats import refresh_stats
+from migrations import apply_migrations
+
+# name -> borrow_log rows and the volumes that go with them
+SCALES = {
+    '1k': {'loans': 1_000, 'books': 1_000, 'categories': 20, 'students': 200},
+    '100k': {'loans': 100_000, 'books': 20_000, 'categories': 50, 'students': 5_000},
+    '10m': {'loans': 10_000_000, 'books': 1_000_000, 'categories': 200, 'students': 200_000},
+}
+GENERATED_TABLES = ('categories', 'books', 'users', 'borrow_log', 'reading_history', 'fines')
+CHUNK = 50_000
+
+SUBJECTS = (
+    'Algorithms', 'Architecture', 'Art History', 'Astronomy', 'Biology', 'Chemistry', 'Classics',
+    'Computer Networks', 'Data Science', 'Databases', 'Design', 'Ecology', 'Economics', 'Education',
+    'Electronics', 'Engineering', 'Film', 'Finance', 'Geography', 'Geology', 'History', 'Law',
+    'Linguistics', 'Literature', 'Machine Learning', 'Management', 'Marketing', 'Mathematics',
+    'Medicine', 'Music', 'Neuroscience', 'Operating Systems', 'Philosophy', 'Physics', 'Poetry',
+    'Political Science', 'Programming', 'Psychology', 'Religion', 'Robotics', 'Sociology', 'Statistics',
+)
+GENRES = ('Textbook', 'Reference', 'Non-fiction', 'Fiction', 'Biography', 'Handbook', 'Essays', 'Science')
+ADJECTIVES = (
+    'Advanced', 'Applied', 'Essential', 'Modern', 'Practical', 'Classic', 'Concise', 'Complete',
+    'Hidden', 'Elementary', 'Quiet', 'Restless', 'Lost', 'Silent', 'Brief', 'Visual', 'Open', 'Deep',
+)
+NOUNS = (
+    'Foundations', 'Principles', 'Methods', 'Patterns', 'Theory', 'Handbook', 'Companion', 'Guide',
+    'Journey', 'Voices', 'Rivers', 'Machines', 'Systems', 'Questions', 'Stories', 'Maps', 'Letters',
+)
+FIRST_NAMES = (
+    'Aisha', 'Alex', 'Amir', 'Ana', 'Ben', 'Chen', 'Chloe', 'Daniel', 'Elena', 'Farah', 'Grace', 'Hana',
+    'Ibrahim', 'Isla', 'James', 'Jin', 'Kofi', 'Laura', 'Leo', 'Maria', 'Mateo', 'Mei', 'Nadia', 'Noah',
+    'Olga', 'Omar', 'Priya', 'Ravi', 'Rosa', 'Sam', 'Sara', 'Tomas', 'Uma', 'Wei', 'Yusuf', 'Zoe',
+)
+LAST_NAMES = (
+    'Ahmed', 'Andersen', 'Baker', 'Costa', 'Das', 'Dubois', 'Evans', 'Fischer', 'Garcia', 'Haddad',
+    'Ivanova', 'Johnson', 'Kato', 'Kim', 'Kowalski', 'Lopez', 'Martin', 'Mensah', 'Meyer', 'Nguyen',
+    'Okafor', 'Patel', 'Rossi', 'Santos', 'Schmidt', 'Silva', 'Singh', 'Smith', 'Tanaka', 'Wang', 'Zhang',
+)
+MANUAL_FINES = ('Lost library card', 'Damaged book', 'Late equipment return', 'Lost book replacement')
+
+
+def isbn13(n):
+    """A valid ISBN-13 in the 979-8 range, unique for every ``n`` below 10**8."""
+    body = f'9798{n:08d}'
+    return body + str(-sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(body)) % 10)
+
+
+def skewed(rng, n, exponent):
+    """0 <= index < n, low indexes far more often: a few popular books, a few heavy readers."""
+    return min(int(n * rng.random() ** exponent), n - 1)
+
+
+def next_id(conn, table):
+    # AUTOINCREMENT never reuses an id, so start past both the sequence and the rows
+    seq = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+    return max(seq[0] if seq else 0, conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]) + 1
+
+
+def drop_triggers(conn):
+    """Drop the triggers on the generated tables; returns their SQL for recreate_triggers()."""
+    triggers = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN (SELECT value FROM json_each(?))",
+        (json.dumps(GENERATED_TABLES),)).fetchall()
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER "{name}"')
+    return triggers
+
+
+def recreate_triggers(conn, triggers):
+    for _, sql in triggers:
+        conn.execute(sql)
+
+
+def generate_categories(conn, rng, count):
+    """Returns (id, subject) for each new category; names past the subject list get a number."""
+    first = next_id(conn, 'categories')
+    taken = {row[0].lower() for row in conn.execute('SELECT name FROM categories')}
+    rows = []
+    n = 0
+    while len(rows) < count:
+        subject = SUBJECTS[n % len(SUBJECTS)]
+        name = subject if n < len(SUBJECTS) else f'{subject} {n // len(SUBJECTS) + 1}'
+        n += 1
+        if name.lower() not in taken:
+            rows.append((first + len(rows), name, subject))
+    conn.executemany('INSERT INTO categories (id, name, description) VALUES (?, ?, ?)', [
+        (category_id, name, f'Books on {subject.lower()}, from introductions to {rng.choice(NOUNS).lower()}.')
+        for category_id, name, subject in rows])
+    return [(category_id, subject) for category_id, _, subject in rows]
+
+
+def generate_books(conn, rng, count, categories):
+    first = next_id(conn, 'books')
+
+    def rows():
+        for i in range(count):
+            category_id, subject = rng.choice(categories)
+            pattern = rng.random()
+            if pattern < 0.4:
+                title = f'{rng.choice(ADJECTIVES)} {subject}'
+            elif pattern < 0.7:
+                title = f'{rng.choice(NOUNS)} of {subject}'
+            elif pattern < 0.85:
+                title = f'Introduction to {subject}'
+            else:
+                title = f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'
+            if rng.random() < 0.3:
+                title += f', Volume {rng.randint(1, 4)}'
+            author = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+            # A few books are uncategorised, as in hand-entered catalogs
+            yield (first + i, title, author, rng.choice(GENRES), isbn13(first + i),
+                   category_id if rng.random() > 0.05 else None)
+
+    # executemany() pulls from the generator, so a million books never sit in memory
+    conn.executemany('INSERT INTO books (id, title, author, genre, isbn, category_id, available) '
+                    'VALUES (?, ?, ?, ?, ?, ?, 1)', rows())
+    return first
+
+
+def generate_students(conn, rng, count, first_day):
+    first = next_id(conn, 'users')
+
+    def rows():
+        for i in range(count):
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            username = f'{first_name}.{last_name}{first + i}'.lower()
+            joined = first_day - timedelta(days=rng.randint(0, 365))
+            yield (first + i, username, 'password', f'{username}@students.example.edu',
+                   f'555-{rng.randint(0, 9999):04d}', f'{rng.randint(1, 999)} {rng.choice(LAST_NAMES)} Street',
+                   f'{joined} 09:00:00')
+
+    conn.executemany("INSERT INTO users (id, username, password, email, phone, address, role, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 'student', ?)", rows())
+    return first
+
+
+LOAN_SQL = 'INSERT INTO borrow_log (id, user_id, book_id, issue_date, due_date, returned, return_date) ' \
+           'VALUES (?, ?, ?, ?, ?, ?, ?)'
+HISTORY_SQL = 'INSERT INTO reading_history (id, user_id, book_id, borrow_date, return_date) VALUES (?, ?, ?, ?, ?)'
+LOAN_FINE_SQL = '''
+    INSERT INTO fines (user_id, borrow_id, amount, reason, paid, created_at, paid_at)
+    SELECT ?, ?, ?, 'Overdue: ' || COALESCE(title, 'book #' || id), ?, ?, ?
+    FROM books WHERE id = ?
+'''
+
+
+def generate_loans(conn, rng, count, first_book, n_books, first_user, n_students, today, days,
+                   late_ratio, lost_ratio, paid_ratio, loan_days, fine_rate):
+    """borrow_log, reading_history and late-return fines; returns (loans, open loans, fines) written."""
+    first_loan = next_id(conn, 'borrow_log')
+    first_history = next_id(conn, 'reading_history')
+    start = today - timedelta(days=days)
+    open_books = set()
+    loans, histories, fines = [], [], []
+    written = fined = 0
+
+    def flush():
+        conn.executemany(LOAN_SQL, loans)
+        conn.executemany(HISTORY_SQL, histories)
+        conn.executemany(LOAN_FINE_SQL, fines)
+        loans.clear()
+        histories.clear()
+        fines.clear()
+
+    for i in range(count):
+        issued = start + timedelta(days=days * i // count)
+        due = issued + timedelta(days=loan_days)
+        draw = rng.random()
+        if draw < lost_ratio:
+            returned = None
+        elif draw < lost_ratio + late_ratio:
+            returned = due + timedelta(days=rng.randint(1, 30))
+        else:
+            returned = issued + timedelta(days=rng.randint(0, loan_days))
+        if returned is not None and returned > today:
+            returned = None
+        book_id = first_book + skewed(rng, n_books, 1.5)
+        if returned is None:
+            # Still out today: needs a copy nobody else has
+            for _ in range(10):
+                if book_id not in open_books:
+                    break
+                book_id = first_book + rng.randrange(n_books)
+            else:
+                continue
+            open_books.add(book_id)
+        user_id = first_user + skewed(rng, n_students, 2)
+        loan_id = first_loan + written
+        borrowed_at = datetime.combine(issued, datetime.min.time()) + timedelta(seconds=rng.randint(28800, 72000))
+        loans.append((loan_id, user_id, book_id, issued, due, int(returned is not None), returned))
+        histories.append((first_history + written, user_id, book_id, borrowed_at,
+                          None if returned is None else datetime.combine(returned, borrowed_at.time())))
+        written += 1
+        if returned is not None and returned > due:
+            paid_at = returned + timedelta(days=rng.randint(0, 20))
+            paid = rng.random() < paid_ratio and paid_at <= today
+            fines.append((user_id, loan_id, round((returned - due).days * fine_rate, 2), int(paid),
+                          f'{returned} 12:00:00', f'{paid_at} 12:00:00' if paid else None, book_id))
+            fined += 1
+        if len(loans) == CHUNK:
+            flush()
+    flush()
+    if open_books:
+        conn.execute('UPDATE books SET available = 0 WHERE id IN (SELECT value FROM json_each(?))',
+                     (f"[{','.join(map(str, open_books))}]",))
+    return written, len(open_books), fined
+
+
+def generate_manual_fines(conn, rng, first_user, n_students, today):
+    """Fines not tied to a loan, for about 1% of students."""
+    rows = []
+    for _ in range(max(1, n_students // 100)):
+        created = today - timedelta(days=rng.randint(0, 365))
+        paid = rng.random() < 0.5
+        rows.append((first_user + rng.randrange(n_students), rng.choice((2.5, 5.0, 10.0, 25.0)),
+                     rng.choice(MANUAL_FINES), int(paid), f'{created} 10:00:00',
+                     f'{created + timedelta(days=7)} 10:00:00' if paid else None))
+    conn.executemany('INSERT INTO fines (user_id, amount, reason, paid, created_at, paid_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', rows)
+    return len(rows)
+
+
+def rebuild_derived(conn, first_book):
+    """What the dropped triggers would have written for the new books."""
+    conn.execute('''
+        INSERT INTO books_fts (rowid, title, author, genre, isbn, category_name)
+        SELECT b.id, b.title, b.author, b.genre, replace(b.isbn, '-', ''), c.name
+        FROM books b
+        LEFT JOIN categories c ON b.category_id = c.id
+        WHERE b.id >= ?
+    ''', (first_book,))
+    conn.execute('INSERT INTO catalog_changes (book_id) SELECT id FROM books WHERE id >= ?', (first_book,))
+    conn.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'catalog'")
+
+
+def generate(conn, loans, books, categories, students, seed=42, days=730, late_ratio=0.12, lost_ratio=0.005,
+             paid_ratio=0.7, loan_days=Config.LOAN_PERIOD_DAYS, fine_rate=Config.FINE_PER_DAY, today=None,
+             out=sys.stdout):
+    """Write one synthetic library into ``conn`` (migrated, not in a transaction); returns row counts."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    started = time.perf_counter()
+    counts = {}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        triggers = drop_triggers(conn)
+        category_rows = generate_categories(conn, rng, categories)
+        first_book = generate_books(conn, rng, books, category_rows)
+        first_user = generate_students(conn, rng, students, today - timedelta(days=days))
+        counts['loans'], counts['open loans'], counts['fines'] = generate_loans(
+            conn, rng, loans, first_book, books, first_user, students, today, days,
+            late_ratio, lost_ratio, paid_ratio, loan_days, fine_rate)
+        counts['fines'] += generate_manual_fines(conn, rng, first_user, students, today)
+        rebuild_derived(conn, first_book)
+        recreate_triggers(conn, triggers)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    counts.update(categories=categories, books=books, students=students)
+    # Open loans past their due date, through the same batch the server runs
+    counts['overdue fines'] = accrue_fines(conn, fine_rate, today)
+    refresh_stats(conn)
+    print(f"Generated in {time.perf_counter() - started:.1f}s: "
+          + ', '.join(f'{value:,} {name}' for name, value in counts.items()), file=out)
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill a database with a synthetic library.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k', help='borrow_log size preset')
+    parser.add_argument('--database', default='books.db')
+    for name in ('books', 'categories', 'students', 'loans'):
+        parser.add_argument(f'--{name}', type=int, help=f'override the preset number of {name}')
+    parser.add_argument('--days', type=int, default=730, help='history spread over this many days')
+    parser.add_argument('--late-ratio', type=float, default=0.12, help='share of loans returned late')
+    parser.add_argument('--lost-ratio', type=float, default=0.005, help='share of loans never returned')
+    parser.add_argument('--paid-ratio', type=float, default=0.7, help='share of late-return fines paid')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--append', action='store_true', help='add to a database that already has books')
+    args = parser.parse_args()
+
+    volumes = {name: getattr(args, name) or SCALES[args.scale][name] for name in SCALES[args.scale]}
+    conn = sqlite3.connect(args.database, timeout=30)
+    apply_migrations(conn)
+    if not args.append and conn.execute('SELECT 1 FROM books LIMIT 1').fetchone():
+        sys.exit(f'{args.database} already has books; use --append to add to them.')
+    conn.execute('PRAGMA journal_mode = WAL')
+    generate(conn, seed=args.seed, days=args.days, late_ratio=args.late_ratio, lost_ratio=args.lost_ratio,
+             paid_ratio=args.paid_ratio, **volumes)
+    conn.close()
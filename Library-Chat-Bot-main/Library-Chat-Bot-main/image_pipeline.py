@@ -0,0 +1,225 @@
+"""Background resizing of uploaded profile pictures and book covers.
+
+A request only hashes and stores the original upload (no decoding beyond reading the
+header to reject non-images) and points the user/book at a placeholder. Decoding and
+resizing run in a ProcessPoolExecutor, so a 12-megapixel phone photo never ties up a
+request worker; when a job finishes the row is switched to the resized image.
+
+Files are named after the SHA-256 of the original upload, so the same picture uploaded
+twice is stored and processed once:
+
+    <folder>/originals/<digest>.<ext>         the upload as received
+    <folder>/<digest>-<size>.jpg|png          each size (PNG when the image has alpha)
+    <folder>/<digest>-<size>.webp             the same sizes as WebP
+
+The first size of each kind is the one stored in users.profile_pic/books.cover_image.
+"""
+import hashlib
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+PLACEHOLDER = 'placeholder.png'
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+# kind -> sizes to render (the first is stored on the row) and how to point the row at it
+IMAGE_KINDS = {
+    'profile': {
+        'sizes': (200, 64),
+        'update_sql': '''
+            UPDATE users SET profile_pic = ?
+            WHERE id = ? AND NOT EXISTS (
+                SELECT 1 FROM image_jobs WHERE kind = 'profile' AND target_id = users.id AND id > ?
+            )
+        ''',
+    },
+    'cover': {
+        'sizes': (400, 200, 100),
+        'update_sql': '''
+            UPDATE books SET cover_image = ?
+            WHERE id = ? AND NOT EXISTS (
+                SELECT 1 FROM image_jobs WHERE kind = 'cover' AND target_id = books.id AND id > ?
+            )
+        ''',
+    },
+}
+
+
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 80, 'method': 4},
+}
+
+
+def _tmp_path(path):
+    # Unique per process and thread: workers starting together may write the same file
+    return f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+
+
+def _write(image, path, fmt):
+    # Write next to the target and rename, so a half-written file is never served
+    tmp = _tmp_path(path)
+    image.save(tmp, format=fmt, **SAVE_OPTIONS[fmt])
+    os.replace(tmp, path)
+
+
+def render_variants(original, folder, digest, sizes):
+    """Worker process entry point: write every size (and its WebP) for one original.
+
+    Returns the file names written, the primary size first.
+    """
+    with Image.open(original) as image:
+        # JPEG can decode straight at a fraction of full size; far cheaper for big photos
+        image.draft('RGB', (sizes[0] * 2, sizes[0] * 2))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        ext, fmt = ('png', 'PNG') if has_alpha else ('jpg', 'JPEG')
+        names = []
+        for size in sizes:
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            for name, variant_fmt in ((f'{digest}-{size}.{ext}', fmt), (f'{digest}-{size}.webp', 'WEBP')):
+                _write(variant, os.path.join(folder, name), variant_fmt)
+                names.append(name)
+    return names
+
+
+def ensure_placeholder(folder, size):
+    path = os.path.join(folder, PLACEHOLDER)
+    if not os.path.exists(path):
+        _write(Image.new('RGB', (size, size), (224, 224, 224)), path, 'PNG')
+
+
+class ImagePipeline:
+    def __init__(self, folders, get_connection, max_workers=2, logger=None):
+        self.folders = folders              # kind -> directory
+        self.get_connection = get_connection
+        self.max_workers = max_workers
+        self.logger = logger
+        # observer(kind, target_id) after a row is switched to its resized image
+        self.observers = []
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        for kind, folder in folders.items():
+            os.makedirs(os.path.join(folder, 'originals'), exist_ok=True)
+            ensure_placeholder(folder, IMAGE_KINDS[kind]['sizes'][0])
+
+    def _get_executor(self):
+        # Created on first use in each process; a forked worker must not reuse its parent's pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _primary_name(self, kind, digest):
+        size = IMAGE_KINDS[kind]['sizes'][0]
+        for ext in ('jpg', 'png'):
+            name = f'{digest}-{size}.{ext}'
+            if os.path.exists(os.path.join(self.folders[kind], name)):
+                return name
+        return None
+
+    def accept(self, kind, upload):
+        """Store an uploaded file and return (original, filename to save on the row now).
+
+        ``original`` is the stored upload's name, to pass to enqueue() once the row is committed.
+
+        The filename is the finished image when this exact picture was processed before,
+        otherwise the placeholder. Raises ValueError for files that are not images.
+        """
+        data = upload.read()
+        ext = upload.filename.rsplit('.', 1)[-1].lower() if '.' in upload.filename else ''
+        if ext not in ALLOWED_EXTENSIONS or not data:
+            raise ValueError('Unsupported image file.')
+        try:
+            # Only parses the header; the full decode happens in the worker
+            Image.open(io.BytesIO(data))
+        except Exception:
+            raise ValueError('The uploaded file is not a readable image.')
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        original = os.path.join(self.folders[kind], 'originals', f'{digest}.{ext}')
+        if not os.path.exists(original):
+            tmp = _tmp_path(original)
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, original)
+        return f'{digest}.{ext}', self._primary_name(kind, digest) or PLACEHOLDER
+
+    def enqueue(self, kind, target_id, original):
+        """Queue resizing for a row, after the caller committed the placeholder.
+
+        Already-processed pictures are recorded as done straight away; the job row still
+        matters, it stops an older upload still in flight from overwriting this one.
+        """
+        name = self._primary_name(kind, original.split('.')[0])
+        conn = self.get_connection()
+        try:
+            job_id = conn.execute(
+                'INSERT INTO image_jobs (kind, target_id, original, status) VALUES (?, ?, ?, ?)',
+                (kind, target_id, original, 'done' if name else 'pending')).lastrowid
+            conn.commit()
+        finally:
+            conn.close()
+        if not name:
+            self._submit(job_id, kind, target_id, original)
+        return job_id
+
+    def _submit(self, job_id, kind, target_id, original):
+        folder = self.folders[kind]
+        path = os.path.join(folder, 'originals', original)
+        if not os.path.exists(path):
+            self._finish(job_id, kind, target_id, None, 'original upload is missing')
+            return
+        future = self._get_executor().submit(render_variants, path, folder, original.split('.')[0],
+                                             IMAGE_KINDS[kind]['sizes'])
+        future.add_done_callback(lambda f: self._finish(job_id, kind, target_id, f))
+
+    def _finish(self, job_id, kind, target_id, future, error=None):
+        # Runs on the executor's callback thread in this process
+        names = None
+        if future is not None:
+            try:
+                names = future.result()
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if names:
+                conn.execute("UPDATE image_jobs SET status = 'done', finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                             (job_id,))
+                # Skipped when a newer upload for the same row is already queued or done
+                conn.execute(IMAGE_KINDS[kind]['update_sql'], (names[0], target_id, job_id))
+            else:
+                conn.execute(
+                    "UPDATE image_jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (error, job_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        if names:
+            for observer in self.observers:
+                observer(kind, target_id)
+        if error and self.logger:
+            self.logger.error('Image job %s (%s %s) failed: %s', job_id, kind, target_id, error)
+
+    def resume_pending(self):
+        """Re-queue jobs a previous run left unfinished. Rendering is idempotent, so a job
+        another live worker is still processing just gets written twice."""
+        conn = self.get_connection()
+        jobs = conn.execute(
+            "SELECT id, kind, target_id, original FROM image_jobs WHERE status = 'pending'").fetchall()
+        conn.close()
+        for job in jobs:
+            self._submit(job['id'], job['kind'], job['target_id'], job['original'])
+        return len(jobs)
@@ -0,0 +1,328 @@
+"""Bulk catalog import from CSV or JSONL exports.
+
+Usage: python import_books.py FILE [--database books.db] [--batch-size 5000]
+                              [--format csv|jsonl] [--defer-indexes] [--restart]
+
+Records need a title and author; genre, isbn, category, category_description and
+available are optional (CSV header names or JSONL keys, case-insensitive). Files
+ending in .gz are read compressed. The input is streamed and inserted in one
+transaction per batch, so memory stays flat however large the file is.
+
+ISBNs are normalised to ISBN-13 digits (hyphens and spaces dropped, ISBN-10
+converted); records whose ISBN fails its checksum are rejected. A record whose ISBN
+is already in books, or earlier in the file, is skipped as a duplicate. Categories
+are matched by name, case-insensitively, and created when missing.
+
+Each batch commits together with the run's position in import_runs (migration 12):
+running the same command again after an interruption resumes after the last
+committed batch, and a file that was fully imported is not loaded twice.
+
+--defer-indexes is for large loads in a quiet period: the secondary indexes on books
+and the per-row insert triggers (full-text search, statistics, catalog change log,
+data version) are dropped for the load and rebuilt once at the end, for every book
+added since the run started. If the run is interrupted they stay dropped until the
+import is run again. Rebuild the semantic index afterwards: python catalog_index.py
+"""
+import argparse
+import csv
+import gzip
+import itertools
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from library_stats import refresh_stats
+from migrations import apply_migrations
+
+FIELDS = ('title', 'author', 'genre', 'isbn', 'category', 'category_description', 'available')
+YES = {'1', 'yes', 'y', 'true', 't', 'available'}
+NO = {'0', 'no', 'n', 'false', 'f', 'unavailable', 'borrowed'}
+
+# Maintenance a --defer-indexes load suspends; restore_maintenance() catches up in bulk
+DEFERRED_TRIGGERS = ('books_fts_insert', 'library_stats_book_insert', 'catalog_changes_book_insert',
+                     'data_versions_book_insert')
+DEFERRED_INDEXES = ('idx_books_title', 'idx_books_available_title', 'idx_books_category',
+                    'idx_books_cover_image')
+
+FIND_RUN_SQL = 'SELECT * FROM import_runs WHERE source = ? AND fingerprint = ? ORDER BY id DESC LIMIT 1'
+SUSPENDED_RUNS_SQL = 'SELECT * FROM import_runs WHERE suspended IS NOT NULL ORDER BY id'
+# Matches however the stored ISBN was hyphenated (idx_books_isbn_compact, migration 12)
+EXISTING_ISBNS_SQL = '''
+    SELECT replace(isbn, '-', '') FROM books
+    WHERE replace(isbn, '-', '') IN (SELECT value FROM json_each(?))
+'''
+INSERT_BOOK_SQL = '''
+    INSERT INTO books (title, author, genre, isbn, category_id, available)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (isbn) DO NOTHING
+'''
+CHECKPOINT_SQL = '''
+    UPDATE import_runs
+    SET position = ?, inserted = inserted + ?, duplicates = duplicates + ?, invalid = invalid + ?
+    WHERE id = ?
+'''
+
+
+def normalize_isbn(value):
+    """ISBN-13 digits for a valid ISBN-10 or ISBN-13, '' when there is none, None when invalid."""
+    compact = re.sub(r'[\s-]', '', str(value or '')).upper()
+    if not compact:
+        return ''
+    if re.fullmatch(r'\d{9}[\dX]', compact):
+        if sum((10 - i) * (10 if c == 'X' else int(c)) for i, c in enumerate(compact)) % 11:
+            return None
+        compact = '978' + compact[:9]
+        return compact + str(-sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(compact)) % 10)
+    if re.fullmatch(r'\d{13}', compact):
+        if sum(int(c) * (3 if i % 2 else 1) for i, c in enumerate(compact)) % 10:
+            return None
+        return compact
+    return None
+
+
+def isbn_spellings(isbn13):
+    """The compact forms a book may already be stored under: ISBN-13 and, for 978 numbers, ISBN-10."""
+    if not isbn13.startswith('978'):
+        return (isbn13,)
+    body = isbn13[3:12]
+    check = -sum((10 - i) * int(c) for i, c in enumerate(body)) % 11
+    return isbn13, body + ('X' if check == 10 else str(check))
+
+
+def read_records(path, fmt):
+    """Yield each input record as a dict with lower-case keys; None for a line that is not JSON."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                yield {(key or '').strip().lower(): value for key, value in row.items()}
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield None
+                    continue
+                yield {str(key).lower(): value for key, value in record.items()} if isinstance(record, dict) else None
+
+
+def clean_record(record):
+    """(title, author, genre, isbn, category, category_description, available), or an error string."""
+    if record is None:
+        return 'unreadable record'
+    values = {field: str(record.get(field) or '').strip() for field in FIELDS}
+    if not values['title'] or not values['author']:
+        return 'title and author are required'
+    isbn = normalize_isbn(values['isbn'])
+    if isbn is None:
+        return f"invalid ISBN {values['isbn']!r}"
+    available = values['available'].lower()
+    if available and available not in YES | NO:
+        return f"unrecognised availability {values['available']!r}"
+    category = values['category'] or str(record.get('category_name') or '').strip()
+    return (values['title'], values['author'], values['genre'] or None, isbn or None, category or None,
+            values['category_description'] or None, 0 if available in NO else 1)
+
+
+class CategoryResolver:
+    """Category ids by case-insensitive name, creating missing categories inside the current batch."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.ids = {}
+        self.reload()
+
+    def reload(self):
+        # categories is small; a failed batch calls this to forget ids it rolled back
+        self.ids = {row[1].lower(): row[0] for row in self.conn.execute('SELECT id, name FROM categories')}
+
+    def resolve(self, name, description):
+        if not name:
+            return None
+        category_id = self.ids.get(name.lower())
+        if category_id is None:
+            category_id = self.conn.execute('INSERT INTO categories (name, description) VALUES (?, ?)',
+                                            (name, description)).lastrowid
+            self.ids[name.lower()] = category_id
+        return category_id
+
+
+def insert_batch(conn, categories, records, run_id, position):
+    """Insert one batch and advance the checkpoint in the same transaction; returns the counts."""
+    rows, invalid, errors = [], 0, []
+    for record in records:
+        cleaned = clean_record(record)
+        if isinstance(cleaned, str):
+            invalid += 1
+            errors.append(cleaned)
+        else:
+            rows.append(cleaned)
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Books added by hand hold the ISBN as typed, possibly hyphenated or as ISBN-10
+        spellings = {row[3]: isbn_spellings(row[3]) for row in rows if row[3]}
+        lookup = [value for values in spellings.values() for value in values]
+        existing = {row[0] for row in conn.execute(EXISTING_ISBNS_SQL, (json.dumps(lookup),))}
+        seen = set()
+        new_rows = []
+        for title, author, genre, isbn, category, description, available in rows:
+            if isbn and (isbn in seen or not existing.isdisjoint(spellings[isbn])):
+                continue
+            if isbn:
+                seen.add(isbn)
+            new_rows.append((title, author, genre, isbn, categories.resolve(category, description), available))
+        # rowcount sums the rows each INSERT changed, trigger writes excluded
+        inserted = max(conn.executemany(INSERT_BOOK_SQL, new_rows).rowcount, 0)
+        duplicates = len(rows) - inserted
+        conn.execute(CHECKPOINT_SQL, (position, inserted, duplicates, invalid, run_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        categories.reload()
+        raise
+    return inserted, duplicates, invalid, errors
+
+
+def suspend_maintenance(conn, run_id):
+    """Drop the deferred indexes and insert triggers, remembering their SQL on the run."""
+    names = DEFERRED_TRIGGERS + DEFERRED_INDEXES
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        suspended = [list(row) for row in conn.execute(
+            'SELECT name, type, sql FROM sqlite_master WHERE name IN (SELECT value FROM json_each(?))',
+            (json.dumps(names),))]
+        for name, kind, _ in suspended:
+            conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+        conn.execute('UPDATE import_runs SET suspended = ? WHERE id = ?', (json.dumps(suspended), run_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return len(suspended)
+
+
+def restore_maintenance(conn, run):
+    """Recreate what suspend_maintenance() dropped and bring its derived data up to date."""
+    first_book_id = run['first_book_id']
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Books loaded while the triggers were gone, whoever inserted them
+        conn.execute('DELETE FROM books_fts WHERE rowid > ?', (first_book_id,))
+        conn.execute('''
+            INSERT INTO books_fts (rowid, title, author, genre, isbn, category_name)
+            SELECT b.id, b.title, b.author, b.genre, replace(b.isbn, '-', ''), c.name
+            FROM books b
+            LEFT JOIN categories c ON b.category_id = c.id
+            WHERE b.id > ?
+        ''', (first_book_id,))
+        conn.execute('INSERT INTO catalog_changes (book_id) SELECT id FROM books WHERE id > ?', (first_book_id,))
+        conn.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'catalog'")
+        for name, kind, sql in json.loads(run['suspended']):
+            exists = conn.execute('SELECT 1 FROM sqlite_master WHERE type = ? AND name = ?', (kind, name)).fetchone()
+            if not exists:
+                conn.execute(sql)
+        conn.execute('UPDATE import_runs SET suspended = NULL WHERE id = ?', (run['id'],))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    # Counters were not maintained during the load; recount them
+    refresh_stats(conn)
+
+
+def start_run(conn, source, fingerprint, restart):
+    run = conn.execute(FIND_RUN_SQL, (source, fingerprint)).fetchone()
+    if run is not None and not restart:
+        return run
+    run_id = conn.execute('INSERT INTO import_runs (source, fingerprint, first_book_id) '
+                          'SELECT ?, ?, COALESCE(MAX(id), 0) FROM books', (source, fingerprint)).lastrowid
+    conn.commit()
+    return conn.execute('SELECT * FROM import_runs WHERE id = ?', (run_id,)).fetchone()
+
+
+def import_file(conn, path, fmt=None, batch_size=5000, defer_indexes=False, restart=False, out=sys.stdout):
+    """Stream ``path`` into books; returns the finished import_runs row."""
+    fmt = fmt or ('jsonl' if re.search(r'\.(jsonl|ndjson|json)(\.gz)?$', path) else 'csv')
+    source = os.path.abspath(path)
+    stat = os.stat(path)
+    run = start_run(conn, source, f'{stat.st_size}:{stat.st_mtime_ns}', restart)
+    if run['finished_at'] is not None:
+        print(f"{path} was already imported (run {run['id']}, {run['inserted']} books); "
+              f"use --restart to load it again.", file=out)
+        return run
+
+    # An earlier interrupted --defer-indexes run of another file must not stay half-done
+    for other in conn.execute(SUSPENDED_RUNS_SQL).fetchall():
+        if other['id'] != run['id']:
+            print(f"Restoring indexes and triggers left dropped by run {other['id']}...", file=out)
+            restore_maintenance(conn, other)
+    if defer_indexes and run['suspended'] is None:
+        print(f"Suspended {suspend_maintenance(conn, run['id'])} indexes and triggers for the load.", file=out)
+
+    position = run['position']
+    if position:
+        print(f"Resuming run {run['id']} after {position} records.", file=out)
+    categories = CategoryResolver(conn)
+    records = itertools.islice(read_records(path, fmt), position, None)
+    totals = [0, 0, 0]
+    started = time.perf_counter()
+    shown_errors = 0
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            break
+        position += len(batch)
+        counts = insert_batch(conn, categories, batch, run['id'], position)
+        for i in range(3):
+            totals[i] += counts[i]
+        for error in counts[3]:
+            if shown_errors < 10:
+                print(f"  rejected: {error}", file=out)
+            shown_errors += 1
+        elapsed = time.perf_counter() - started
+        done = sum(totals)
+        print(f"{position} records read, {totals[0]} inserted, {totals[1]} duplicates, {totals[2]} invalid "
+              f"({done / elapsed:,.0f} records/s)", file=out)
+
+    run = conn.execute('SELECT * FROM import_runs WHERE id = ?', (run['id'],)).fetchone()
+    if run['suspended'] is not None:
+        rebuild_started = time.perf_counter()
+        restore_maintenance(conn, run)
+        print(f"Rebuilt indexes, search and statistics in {time.perf_counter() - rebuild_started:.1f}s.", file=out)
+    conn.execute('UPDATE import_runs SET finished_at = CURRENT_TIMESTAMP WHERE id = ?', (run['id'],))
+    conn.commit()
+    run = conn.execute('SELECT * FROM import_runs WHERE id = ?', (run['id'],)).fetchone()
+    print(f"Imported {path}: {run['inserted']} books inserted, {run['duplicates']} duplicates, "
+          f"{run['invalid']} invalid in {time.perf_counter() - started:.1f}s.", file=out)
+    return run
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import books from a CSV or JSONL file.')
+    parser.add_argument('file')
+    parser.add_argument('--database', default='books.db')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='default: from the file extension')
+    parser.add_argument('--batch-size', type=int, default=5000, help='records per transaction')
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help='drop book indexes and insert triggers during the load, rebuild at the end')
+    parser.add_argument('--restart', action='store_true', help='ignore an earlier run of the same file')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA cache_size = -65536')
+    apply_migrations(conn)
+    try:
+        import_file(conn, args.file, args.format, max(1, args.batch_size), args.defer_indexes, args.restart)
+        print("Rebuild the semantic search index when done: python catalog_index.py")
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume.")
+        sys.exit(1)
+    finally:
+        conn.close()
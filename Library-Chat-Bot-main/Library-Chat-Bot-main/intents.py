@@ -0,0 +1,215 @@
+"""Intent classification for free-form student chat messages.
+
+Usage: python intents.py [output]     (default: intent_model.npz)
+
+Messages are turned into hashed TF-IDF vectors (words, word bigrams and character
+trigrams, so small typos still match) and compared by cosine similarity against the
+example utterances below; the intent of the best-matching example wins. The model is
+built offline into a small compressed .npz and loaded once at startup. If the file is
+missing, or was built from different examples, it is rebuilt in memory instead.
+"""
+import hashlib
+import re
+import sys
+import zlib
+
+import numpy as np
+
+# Sample titles/authors are in [brackets]: they train the classifier like any other
+# words but are not part of the intent's own vocabulary, so entity extraction keeps them
+INTENT_EXAMPLES = {
+    'search': [
+        'search for a book', 'find books about [history]', 'do you have any books on [python]',
+        'look for books by [tolkien]', 'is there a book called [dune]', 'books about [machine learning]',
+        'i am looking for a novel', 'show me books on [databases]', 'any books written by [orwell]',
+        'find me something to read about [space]', 'do you have [the hobbit]', 'search the catalog',
+        'is book 12 available', 'is [dune] available', 'is [the hobbit] in stock',
+    ],
+    'borrow': [
+        'borrow a book', 'i want to borrow this book', 'can i borrow book 12', 'issue me a book',
+        'i would like to check out [dune]', 'lend me [the hobbit]', 'can i take out a book',
+        'please issue book number 5', 'check out a book for me', 'i need to borrow a novel',
+        'reserve and borrow book id 3', 'get me book 7',
+    ],
+    'return': [
+        'return a book', 'i want to return my book', 'return book 12', 'i am done with [dune]',
+        'give back [the hobbit]', 'i finished reading this book and want to return it',
+        'how do i return a book', 'hand in book 4', 'bring back the book i borrowed',
+        'i would like to give this book back',
+    ],
+    'my_books': [
+        'my books', 'what books do i have', 'which books have i borrowed', 'show my borrowed books',
+        'list my loans', 'what did i check out', 'when are my books due', 'what is my due date',
+        'books i currently have', 'show my issued books', 'do i have any books out',
+    ],
+    'fines': [
+        'my fines', 'do i owe anything', 'how much do i owe', 'show my fines', 'do i have any fines',
+        'what is my fine', 'late fees', 'how much is my late fee', 'overdue charges',
+        'do i need to pay anything', 'outstanding balance', 'what are my dues',
+    ],
+    'help': [
+        'help', 'what can you do', 'how does this work', 'show commands', 'what commands are there',
+        'i need help', 'how do i use this', 'what can i ask', 'menu', 'options',
+    ],
+}
+
+N_FEATURES = 1 << 12
+_WORD = re.compile(r'[a-z0-9]+')
+# Only a number that is marked as one ("id 12", "#12", "book 12", "no. 12", "number 12"):
+# a bare number is just as likely a count, a year or "how long can i keep it 2 weeks"
+_BOOK_ID = re.compile(r'(?:\bid\s*|#\s*|\bbook\s+|\bno\.\s*|\bnumber\s+)(\d+)\b')
+_ENTITY = re.compile(r'\[([^\]]*)\]')
+_QUOTED = re.compile(r'"([^"]+)"|“([^”]+)”|(?<!\w)\'([^\']+)\'(?!\w)')
+# Words that never carry a title on their own, whatever the intent
+_FILLER = {'a', 'an', 'the', 'me', 'my', 'i', 'to', 'for', 'of', 'on', 'by', 'please', 'book', 'books',
+           'id', 'number', 'no', 'called', 'named', 'titled', 'about', 'some', 'any', 'anything',
+           'something', 'with', 'in'}
+
+
+def _features(words):
+    feats = list(words)
+    feats += [f'{a} {b}' for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f'<{word}>'
+        feats += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    return feats
+
+
+def _hash(feature):
+    # crc32 rather than hash(): it must be the same in every process and Python version
+    return zlib.crc32(feature.encode()) & (N_FEATURES - 1)
+
+
+def _term_counts(text):
+    words = _WORD.findall(text.lower())
+    counts = {}
+    for feature in _features(words):
+        index = _hash(feature)
+        counts[index] = counts.get(index, 0) + 1
+    return words, counts
+
+
+def fingerprint(examples=INTENT_EXAMPLES):
+    payload = repr((N_FEATURES, sorted((k, sorted(v)) for k, v in examples.items())))
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+class IntentModel:
+    def __init__(self, intents, labels, weights, idf, vocab, fingerprint):
+        self.intents = list(intents)
+        self.labels = labels            # intent index of each example
+        self.weights = weights          # (N_FEATURES, n_examples) float32, unit-length columns
+        self.idf = idf                  # (N_FEATURES,) float32
+        self.vocab = vocab              # intent -> set of words used by its examples
+        self.fingerprint = fingerprint
+
+    def vectorize(self, text):
+        # Only the handful of features the message actually has: (indices, tf-idf values)
+        words, counts = _term_counts(text)
+        if not counts:
+            return words, None, None
+        indices = np.fromiter(counts, dtype=np.intp, count=len(counts))
+        values = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        values *= self.idf[indices]
+        values /= np.linalg.norm(values)
+        return words, indices, values
+
+    def classify(self, text):
+        """Returns (intent, score, entities); intent is None for an empty message."""
+        words, indices, values = self.vectorize(text)
+        if indices is None:
+            return None, 0.0, {}
+        similarity = values @ self.weights[indices]
+        best = int(np.argmax(similarity))
+        intent = self.intents[self.labels[best]]
+        return intent, float(similarity[best]), self.extract_entities(text, words, intent)
+
+    def extract_entities(self, text, words, intent):
+        """book_id: the first marked number ("book 12", "#12", "id 12", "no. 12").
+        title: quoted text, or failing that the words the intent's examples never use."""
+        entities = {'book_id': None, 'title': None}
+        match = _BOOK_ID.search(text.lower())
+        if match:
+            entities['book_id'] = int(match.group(1))
+        quoted = _QUOTED.search(text)
+        if quoted:
+            entities['title'] = next(group for group in quoted.groups() if group).strip()
+        else:
+            known = self.vocab.get(intent, set())
+            rest = [w for w in words if w not in known and w not in _FILLER and not w.isdigit()]
+            entities['title'] = ' '.join(rest) or None
+        return entities
+
+
+def build_model(examples=INTENT_EXAMPLES):
+    intents = list(examples)
+    labels, rows = [], []
+    for label, intent in enumerate(intents):
+        for utterance in examples[intent]:
+            labels.append(label)
+            rows.append(_term_counts(_ENTITY.sub(r'\1', utterance))[1])
+
+    df = np.zeros(N_FEATURES, dtype=np.float32)
+    for counts in rows:
+        df[list(counts)] += 1
+    # Smoothed idf; features no example uses get the largest weight but match nothing
+    idf = (np.log((1 + len(rows)) / (1 + df)) + 1).astype(np.float32)
+
+    weights = np.zeros((N_FEATURES, len(rows)), dtype=np.float32)
+    for column, counts in enumerate(rows):
+        indices = list(counts)
+        values = (1 + np.log(np.array(list(counts.values()), dtype=np.float32))) * idf[indices]
+        weights[indices, column] = values / np.linalg.norm(values)
+
+    vocab = {intent: {w for u in examples[intent] for w in _WORD.findall(_ENTITY.sub('', u).lower())}
+             for intent in intents}
+    return IntentModel(intents, np.array(labels, dtype=np.int32), weights, idf, vocab, fingerprint(examples))
+
+
+def save_model(model, path):
+    # Stored sparse (the example matrix is >99% zeros) and compressed: a few KB on disk
+    columns = model.weights.T
+    nonzero = columns != 0
+    vocab_intents = [intent for intent in model.intents for _ in sorted(model.vocab[intent])]
+    vocab_words = [word for intent in model.intents for word in sorted(model.vocab[intent])]
+    np.savez_compressed(
+        path,
+        fingerprint=np.array(model.fingerprint),
+        intents=np.array(model.intents),
+        labels=model.labels,
+        idf=model.idf.astype(np.float16),
+        counts=nonzero.sum(axis=1).astype(np.int32),
+        indices=np.nonzero(nonzero)[1].astype(np.int32),
+        values=columns[nonzero].astype(np.float16),
+        vocab_intents=np.array(vocab_intents),
+        vocab_words=np.array(vocab_words),
+    )
+
+
+def load_model(path):
+    """Load a model saved by save_model(); rebuilt in memory when missing or out of date."""
+    try:
+        data = np.load(path)
+    except FileNotFoundError:
+        print(f"DEBUG: Intent model {path} not found, building it in memory.")
+        return build_model()
+    with data:
+        if str(data['fingerprint']) != fingerprint():
+            print(f"DEBUG: Intent model {path} is out of date, building it in memory.")
+            return build_model()
+        labels = data['labels']
+        weights = np.zeros((N_FEATURES, len(labels)), dtype=np.float32)
+        columns = np.repeat(np.arange(len(labels)), data['counts'])
+        weights[data['indices'], columns] = data['values']
+        vocab = {}
+        for intent, word in zip(data['vocab_intents'], data['vocab_words']):
+            vocab.setdefault(str(intent), set()).add(str(word))
+        return IntentModel([str(i) for i in data['intents']], labels, weights,
+                           data['idf'].astype(np.float32), vocab, str(data['fingerprint']))
+
+
+if __name__ == '__main__':
+    output = sys.argv[1] if len(sys.argv) > 1 else 'intent_model.npz'
+    model = build_model()
+    save_model(model, output)
+    print(f"Built intent model: {len(model.labels)} examples, {len(model.intents)} intents -> {output}")
@@ -0,0 +1,28 @@
+import threading
+import time
+
+
+def start_periodic(name, interval, task, get_connection, logger=None, run_immediately=False):
+    """Run ``task(conn)`` every ``interval`` seconds on a daemon thread with a pooled connection.
+
+    Failures are logged and the schedule carries on; tasks must be safe to repeat.
+    """
+    def run():
+        if not run_immediately:
+            time.sleep(interval)
+        while True:
+            conn = get_connection()
+            try:
+                result = task(conn)
+                if result and logger:
+                    logger.info('%s: %s', name, result)
+            except Exception as e:
+                if logger:
+                    logger.warning('%s failed: %s', name, e)
+            finally:
+                conn.close()
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name=name, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,54 @@
+# Exact recount for every counter in library_stats. The triggers from migration 5
+# keep these in step with every write; the recount only corrects drift (bulk loads
+# with triggers dropped, manual edits) and moves loans into overdue as days pass.
+# Fine totals (migration 14) are kept in cents so the counters stay integers. Every
+# recount reads its whole table by design, hence the marker check_query_plans.py
+# allows them by.
+RECOUNT_SQL = {
+    'total_books': 'SELECT COUNT(*) FROM books /* recount */',
+    'available_books': 'SELECT COUNT(*) FROM books WHERE available = 1 /* recount */',
+    'total_students': "SELECT COUNT(*) FROM users WHERE role = 'student' /* recount */",
+    'total_borrows': 'SELECT COUNT(*) FROM borrow_log /* recount */',
+    'current_borrows': 'SELECT COUNT(*) FROM borrow_log WHERE returned = 0 /* recount */',
+    'overdue_books': 'SELECT COUNT(*) FROM borrow_log WHERE returned = 0 AND due_date < CURRENT_DATE /* recount */',
+    'total_fines': 'SELECT COUNT(*) FROM fines /* recount */',
+    'unpaid_fine_cents': 'SELECT COALESCE(SUM(CAST(ROUND(amount * 100) AS INTEGER)), 0) FROM fines WHERE paid = 0 /* recount */',
+    'paid_fine_cents': 'SELECT COALESCE(SUM(CAST(ROUND(amount * 100) AS INTEGER)), 0) FROM fines WHERE paid = 1 /* recount */',
+}
+
+
+def read_stats(conn):
+    """All counters as a dict, a single primary-key range read regardless of table sizes."""
+    stats = dict.fromkeys(RECOUNT_SQL, 0)
+    stats.update((row[0], row[1]) for row in conn.execute('SELECT name, value FROM library_stats'))
+    return stats
+
+
+def refresh_stats(conn):
+    """Recount every counter in one write transaction; returns {name: drift} for the ones that were off."""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        current = read_stats(conn)
+        drift = {}
+        for name, sql in RECOUNT_SQL.items():
+            value = conn.execute(sql).fetchone()[0]
+            if value != current[name]:
+                drift[name] = value - current[name]
+            conn.execute('''
+                INSERT INTO library_stats (name, value, refreshed_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value, refreshed_at = excluded.refreshed_at
+            ''', (name, value))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return drift
+
+
+if __name__ == '__main__':
+    # Can also be run from cron: python library_stats.py [database]
+    import sqlite3
+    import sys
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else 'books.db')
+    print(f"Drift corrected: {refresh_stats(conn) or 'none'}")
+    conn.close()
@@ -0,0 +1,99 @@
+# Borrow and return, each as one write transaction.
+#
+# A borrow claims the copy with a conditional UPDATE ... WHERE available = 1 under
+# BEGIN IMMEDIATE: of two requests for the same book exactly one changes a row, the
+# other sees rowcount 0 and writes nothing. A return closes the loan the same way
+# (UPDATE ... WHERE returned = 0), so a double-clicked return cannot settle twice.
+# BEGIN IMMEDIATE takes the write lock up front, so SQLite's busy_timeout applies;
+# a deferred transaction that reads first and upgrades later can fail with
+# "database is locked" straight away. write_transaction() retries what is left.
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from fine_engine import finalize_fine
+
+CLAIM_BOOK_SQL = 'UPDATE books SET available = 0 WHERE id = ? AND available = 1'
+OPEN_LOAN_SQL = '''
+    INSERT INTO borrow_log (user_id, book_id, issue_date, due_date, returned)
+    VALUES (?, ?, ?, ?, 0)
+'''
+OPEN_HISTORY_SQL = 'INSERT INTO reading_history (user_id, book_id, borrow_date) VALUES (?, ?, ?)'
+CLOSE_LOAN_SQL = '''
+    UPDATE borrow_log SET returned = 1, return_date = ?
+    WHERE id = (
+        SELECT id FROM borrow_log WHERE user_id = ? AND book_id = ? AND returned = 0 ORDER BY id LIMIT 1
+    )
+    RETURNING id
+'''
+CLOSE_HISTORY_SQL = '''
+    UPDATE reading_history SET return_date = ?
+    WHERE user_id = ? AND book_id = ? AND return_date IS NULL
+'''
+# Only free the copy when no other loan of it is still open (possible in old data)
+RELEASE_BOOK_SQL = '''
+    UPDATE books SET available = 1
+    WHERE id = ? AND NOT EXISTS (SELECT 1 FROM borrow_log WHERE book_id = ? AND returned = 0)
+'''
+
+
+def _is_busy(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def write_transaction(conn, work, attempts=5, backoff=0.02):
+    """Run ``work(conn)`` in BEGIN IMMEDIATE ... COMMIT and return its result.
+
+    When the database stays locked past busy_timeout the attempt is rolled back and
+    retried after an exponentially growing, jittered pause; other errors (and the
+    last busy one) are raised.
+    """
+    for attempt in range(attempts):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(conn)
+                conn.commit()
+                return result
+            except BaseException:
+                conn.rollback()
+                raise
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt == attempts - 1:
+                raise
+            time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+
+def borrow(conn, user_id, book_id, loan_days=14, **retry):
+    """Lend ``book_id`` to ``user_id``; False when it does not exist or is already out."""
+    borrowed_at = datetime.now().replace(microsecond=0)
+    issue_date = borrowed_at.date()
+
+    def work(conn):
+        if conn.execute(CLAIM_BOOK_SQL, (book_id,)).rowcount == 0:
+            return False
+        conn.execute(OPEN_LOAN_SQL, (user_id, book_id, issue_date, issue_date + timedelta(days=loan_days)))
+        conn.execute(OPEN_HISTORY_SQL, (user_id, book_id, borrowed_at))
+        return True
+
+    return write_transaction(conn, work, **retry)
+
+
+def return_loan(conn, user_id, book_id, fine_rate, **retry):
+    """Close the user's open loan of ``book_id`` and settle its fine; False when there is none."""
+    returned_at = datetime.now().replace(microsecond=0)
+
+    def work(conn):
+        # fetchall() runs the statement to completion, so it is not left open at COMMIT
+        closed = conn.execute(CLOSE_LOAN_SQL, (returned_at.date(), user_id, book_id)).fetchall()
+        if not closed:
+            return False
+        # Settle the overdue fine (if any) at the days actually overdue
+        finalize_fine(conn, closed[0][0], fine_rate)
+        conn.execute(CLOSE_HISTORY_SQL, (returned_at, user_id, book_id))
+        conn.execute(RELEASE_BOOK_SQL, (book_id, book_id))
+        return True
+
+    return write_transaction(conn, work, **retry)
@@ -0,0 +1,117 @@
+"""Serving and garbage-collecting uploaded covers and profile pictures.
+
+Images written by image_pipeline.py are named after the SHA-256 of their content
+(``<digest>-<size>.<ext>``), so a URL never changes meaning: those are sent with a
+one-year ``immutable`` Cache-Control and browsers stop revalidating them. Anything
+else (the placeholder, files from before content hashing) gets ``no-cache`` and is
+revalidated with its ETag, answered with a 304 when unchanged.
+
+Behind a front-end server the file itself can be handed off instead of streamed
+through Python: MEDIA_SENDFILE = 'x-sendfile' (Apache/lighttpd) or
+'x-accel-redirect' (nginx, with an ``internal`` location at MEDIA_ACCEL_PREFIX that
+maps to the app directory). The app still answers the conditional request itself.
+
+Files are never deleted when a row changes. collect_orphans() periodically removes
+every file no user, book or pending image job refers to any more.
+"""
+import mimetypes
+import os
+import re
+import time
+
+from flask import Response, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+from image_pipeline import PLACEHOLDER
+
+HASHED_NAME = re.compile(r'^([0-9a-f]{32})(?:-\d+)?\.[a-z0-9]+$')
+ONE_YEAR = 365 * 24 * 3600
+
+# kind -> every name a row may currently show (DISTINCT reads the covering index)
+REFERENCED_SQL = {
+    'profile': 'SELECT DISTINCT profile_pic FROM users WHERE profile_pic IS NOT NULL',
+    'cover': 'SELECT DISTINCT cover_image FROM books WHERE cover_image IS NOT NULL',
+}
+PENDING_ORIGINALS_SQL = "SELECT kind, original FROM image_jobs WHERE status = 'pending'"
+
+
+def _digest(name):
+    match = HASHED_NAME.match(name)
+    return match.group(1) if match else None
+
+
+def send_media(folder, filename, sendfile=None, accel_prefix='/protected-media/'):
+    """Response for one file directly inside ``folder`` (subdirectories such as originals/ are not served)."""
+    path = safe_join(folder, filename)
+    if path is None or '/' in filename or not os.path.isfile(path):
+        raise NotFound()
+    stat = os.stat(path)
+    immutable = _digest(filename) is not None
+    # A hashed name is its own validator; other files change in place, so use mtime and size
+    etag = filename if immutable else f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if sendfile == 'x-accel-redirect':
+        response = Response(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + path.replace(os.sep, '/')
+    elif sendfile == 'x-sendfile':
+        response = Response(mimetype=mimetype)
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    else:
+        response = send_file(path, mimetype=mimetype, etag=False, conditional=False, max_age=None)
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    if immutable:
+        response.cache_control.no_cache = None    # send_file sets no-cache by default
+        response.cache_control.public = True
+        response.cache_control.max_age = ONE_YEAR
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        # Otherwise the front-end server would still send the file
+        response.headers.pop('X-Accel-Redirect', None)
+        response.headers.pop('X-Sendfile', None)
+    return response
+
+
+def collect_orphans(conn, folders, grace=3600):
+    """Delete image files that nothing refers to; returns (files removed, bytes freed).
+
+    Every size, WebP copy and original of a digest is kept while any row shows one of
+    them or a pending job still has to render it. Files younger than ``grace`` seconds
+    are left alone: an upload is stored before its row is committed.
+    """
+    referenced = {kind: {row[0] for row in conn.execute(REFERENCED_SQL[kind])} for kind in folders}
+    for kind, original in conn.execute(PENDING_ORIGINALS_SQL):
+        if kind in referenced:
+            referenced[kind].add(original)
+    cutoff = time.time() - grace
+    removed = freed = 0
+    for kind, folder in folders.items():
+        names = referenced[kind]
+        digests = {_digest(name) for name in names} - {None}
+        for directory in (folder, os.path.join(folder, 'originals')):
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if not entry.is_file() or entry.name == PLACEHOLDER or entry.name in names:
+                    continue
+                # Leftover .tmp files from an interrupted write are orphans too, once past the grace period
+                digest = None if entry.name.endswith('.tmp') else _digest(entry.name)
+                if digest in digests:
+                    continue
+                try:
+                    stat = entry.stat()
+                    if stat.st_mtime > cutoff:
+                        continue
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += stat.st_size
+    return removed, freed
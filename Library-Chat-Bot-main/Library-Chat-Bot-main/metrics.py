@@ -0,0 +1,261 @@
+"""Request, SQL and chat-command metrics in the Prometheus text format.
+
+AppMetrics.init_app() hooks into Flask (before/after/teardown_request) and the
+connection pool, and server.py serves render() at /admin/metrics:
+
+  library_http_requests_total{endpoint,method,status}       counter
+  library_http_request_errors_total{endpoint,method}        counter (raised or 5xx)
+  library_http_requests_in_flight                           gauge
+  library_http_request_duration_seconds{endpoint,method}    histogram
+  library_sql_statements_per_request{endpoint}              histogram
+  library_sql_statements_total{statement}                   counter (trace callback)
+  library_sql_statement_duration_seconds{statement}         histogram (conn.execute)
+  library_chat_command_duration_seconds{role,command}       histogram
+  library_rate_limited_total{scope}                         counter (429 answers)
+
+``statement`` is the verb and main table ("SELECT borrow_log", "COMMIT"), so the
+label set stays small however many distinct queries run. A request's duration
+runs until its response has been sent, streamed bodies included.
+
+Recording is a dict update under a lock, a few microseconds per request and per
+statement, so it stays on in production. The numbers are per worker process:
+each gunicorn worker counts what it served, and a scrape sees the worker that
+answered it.
+"""
+import bisect
+import math
+import re
+import threading
+import time
+from functools import lru_cache
+
+from flask import request
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+_VERB = re.compile(r'\s*(\w+)')
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE|JOIN)\s+["`\[]?(\w+)', re.IGNORECASE)
+_DATA_VERBS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE'}
+
+
+def _label(sql):
+    match = _VERB.match(sql)
+    if not match:
+        return 'OTHER'
+    verb = match.group(1).upper()
+    if verb in _DATA_VERBS:
+        table = _TABLE.search(sql)
+        if table:
+            return f'{verb} {table.group(1)}'
+    return verb
+
+
+# 'SELECT users', 'INSERT borrow_log', 'BEGIN', ...; cached for the app's own SQL
+# text. Traced SQL has the parameters inlined, so it is labelled uncached.
+statement_label = lru_cache(maxsize=1024)(_label)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield self.name, list(zip(self.labels, label_values)), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        # Per-bucket counts (the last one is +Inf), then the sum; made cumulative on render
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((label_values, list(series)) for label_values, series in self._values.items())
+        for label_values, series in items:
+            labels = list(zip(self.labels, label_values))
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                total += count
+                yield self.name + '_bucket', labels + [('le', _format_value(float(bound)))], total
+            yield self.name + '_sum', labels, series[-1]
+            yield self.name + '_count', labels, total
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class AppMetrics:
+    def __init__(self):
+        self.registry = registry = Registry()
+        self.requests = registry.counter(
+            'library_http_requests_total', 'Requests answered.', ('endpoint', 'method', 'status'))
+        self.errors = registry.counter(
+            'library_http_request_errors_total', 'Requests that raised or answered 5xx.', ('endpoint', 'method'))
+        self.in_flight = registry.gauge('library_http_requests_in_flight', 'Requests being handled.')
+        self.latency = registry.histogram(
+            'library_http_request_duration_seconds', 'Time to handle a request.', ('endpoint', 'method'))
+        self.request_statements = registry.histogram(
+            'library_sql_statements_per_request', 'SQL statements run by one request.', ('endpoint',),
+            COUNT_BUCKETS)
+        self.statements = registry.counter(
+            'library_sql_statements_total', 'SQL statements run, triggers excluded.', ('statement',))
+        self.statement_time = registry.histogram(
+            'library_sql_statement_duration_seconds', 'Time for conn.execute() to return.', ('statement',),
+            SQL_BUCKETS)
+        self.chat = registry.histogram(
+            'library_chat_command_duration_seconds', 'Time to dispatch a chat command.', ('role', 'command'))
+        self.rate_limited = registry.counter(
+            'library_rate_limited_total', 'Requests refused by the rate limiter.', ('scope',))
+        self.in_flight.inc(amount=0)
+        # The request this thread is handling: start time, statement count, status
+        self._local = threading.local()
+
+    def init_app(self, app, pool):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        pool.add_trace_hook(self._trace)
+        pool.add_statement_hook(self._statement)
+
+    def observe_commands(self, role, commands):
+        """Time every dispatch of a CommandRegistry, labelled with ``role`` and the command name."""
+        commands.observers.append(lambda name, seconds: self.chat.observe(seconds, role, name))
+
+    def observe_limiter(self, limiter):
+        """Count the requests a RateLimiter refuses, labelled with the limit's scope."""
+        limiter.observers.append(self.rate_limited.inc)
+
+    def render(self):
+        return self.registry.render()
+
+    def _before_request(self):
+        local = self._local
+        local.started = time.perf_counter()
+        local.statements = 0
+        local.status = None
+        local.streaming = False
+        self.in_flight.inc()
+
+    def _after_request(self, response):
+        local = self._local
+        local.status = response.status_code
+        if response.is_streamed:
+            # The body is produced after teardown_request (which Flask runs again once
+            # a stream_with_context generator ends); finish when the server closes it
+            local.streaming = True
+            endpoint, method = request.endpoint or 'unmatched', request.method
+            response.call_on_close(lambda: self._finish(endpoint, method))
+        return response
+
+    def _teardown_request(self, exc):
+        # Also runs for request contexts that never reached before_request, skipped here
+        local = self._local
+        if getattr(local, 'started', None) is None or local.streaming:
+            return
+        if exc is not None:
+            local.status = None
+        self._finish(request.endpoint or 'unmatched', request.method)
+
+    def _finish(self, endpoint, method):
+        local = self._local
+        if local.started is None:
+            return
+        elapsed = time.perf_counter() - local.started
+        local.started = None
+        # No status: the view raised before a response was made
+        status = local.status or 500
+        self.in_flight.dec()
+        self.requests.inc(endpoint, method, str(status))
+        if status >= 500:
+            self.errors.inc(endpoint, method)
+        self.latency.observe(elapsed, endpoint, method)
+        self.request_statements.observe(local.statements, endpoint)
+
+    def _trace(self, sql):
+        if sql.startswith('--'):
+            return  # run by a trigger
+        self.statements.inc(_label(sql))
+        local = self._local
+        if getattr(local, 'started', None) is not None:
+            local.statements += 1
+
+    def _statement(self, conn, sql, parameters, seconds):
+        self.statement_time.observe(seconds, statement_label(sql))
@@ -0,0 +1,631 @@
+import sqlite3
+
+def _retype_borrow_log(conn):
+    # SQLite cannot change a column's declared type in place: rebuild the table with
+    # DATE columns, normalising the stored values on the way, then restore its
+    # indexes, triggers and AUTOINCREMENT sequence
+    saved = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = 'borrow_log' AND type IN ('index', 'trigger') AND sql IS NOT NULL")]
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'borrow_log'").fetchone()
+    conn.execute('''
+        CREATE TABLE borrow_log_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            issue_date DATE NOT NULL,
+            due_date DATE NOT NULL,
+            returned BOOLEAN DEFAULT 0,
+            return_date DATE,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (book_id) REFERENCES books (id)
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO borrow_log_new (id, user_id, book_id, issue_date, due_date, returned, return_date)
+        SELECT id, user_id, book_id,
+               COALESCE(date(issue_date), issue_date),
+               COALESCE(date(due_date), due_date),
+               returned,
+               COALESCE(date(return_date), return_date)
+        FROM borrow_log
+    ''')
+    conn.execute('DROP TABLE borrow_log')
+    conn.execute('ALTER TABLE borrow_log_new RENAME TO borrow_log')
+    for sql in saved:
+        conn.execute(sql)
+    if seq:
+        conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'borrow_log'", (seq[0],))
+
+
+# Ordered schema migrations. Each entry is (version, description, statements), where a
+# statement is SQL text or a function taking the connection.
+# Never edit a migration that has shipped; append a new one instead.
+MIGRATIONS = [
+    (1, 'initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT UNIQUE,
+            phone TEXT,
+            address TEXT,
+            profile_pic TEXT,
+            role TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            genre TEXT,
+            isbn TEXT UNIQUE,
+            cover_image TEXT,
+            category_id INTEGER,
+            available INTEGER DEFAULT 1,
+            FOREIGN KEY (category_id) REFERENCES categories (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reading_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            borrow_date TIMESTAMP NOT NULL,
+            return_date TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (book_id) REFERENCES books (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS borrow_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            issue_date TEXT NOT NULL,
+            due_date TEXT NOT NULL,
+            returned BOOLEAN DEFAULT 0,
+            return_date TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (book_id) REFERENCES books (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS fines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            reason TEXT NOT NULL,
+            paid BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            paid_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+    ]),
+    (2, 'indexes for hot access paths', [
+        # Open loans per student (dashboard, "my borrowed books", return_book)
+        'CREATE INDEX IF NOT EXISTS idx_borrow_log_user_open ON borrow_log (user_id, returned, book_id, due_date, issue_date)',
+        # Student loan history ordered by issue date
+        'CREATE INDEX IF NOT EXISTS idx_borrow_log_user_issue ON borrow_log (user_id, issue_date)',
+        # Is this copy out? (availability sync, delete checks)
+        'CREATE INDEX IF NOT EXISTS idx_borrow_log_book_open ON borrow_log (book_id, returned)',
+        # Overdue scans only ever look at unreturned loans, keep that index small
+        'CREATE INDEX IF NOT EXISTS idx_borrow_log_overdue ON borrow_log (due_date, user_id, book_id) WHERE returned = 0',
+        # Recent activity / admin borrow history
+        'CREATE INDEX IF NOT EXISTS idx_borrow_log_issue_date ON borrow_log (issue_date)',
+        'CREATE INDEX IF NOT EXISTS idx_reading_history_user_date ON reading_history (user_id, borrow_date, book_id, return_date)',
+        'CREATE INDEX IF NOT EXISTS idx_fines_user_created ON fines (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_fines_created ON fines (created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_fines_paid_amount ON fines (paid, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_users_role_username ON users (role, username)',
+        'CREATE INDEX IF NOT EXISTS idx_books_title ON books (title, id)',
+        'CREATE INDEX IF NOT EXISTS idx_books_available_title ON books (available, title)',
+        'CREATE INDEX IF NOT EXISTS idx_books_category ON books (category_id)',
+        'ANALYZE',
+    ]),
+    (3, 'full-text catalog search', [
+        # rowid is books.id; prefix indexes make "alg*" style queries index lookups too
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5 (
+            title, author, genre, isbn, category_name,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author, genre, isbn, category_name)
+            VALUES (new.id, new.title, new.author, new.genre, replace(new.isbn, '-', ''),
+                    (SELECT name FROM categories WHERE id = new.category_id));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            DELETE FROM books_fts WHERE rowid = old.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_update
+        AFTER UPDATE OF title, author, genre, isbn, category_id ON books BEGIN
+            DELETE FROM books_fts WHERE rowid = old.id;
+            INSERT INTO books_fts (rowid, title, author, genre, isbn, category_name)
+            VALUES (new.id, new.title, new.author, new.genre, replace(new.isbn, '-', ''),
+                    (SELECT name FROM categories WHERE id = new.category_id));
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_category_rename AFTER UPDATE OF name ON categories BEGIN
+            UPDATE books_fts SET category_name = new.name
+            WHERE rowid IN (SELECT id FROM books WHERE category_id = new.id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_category_delete AFTER DELETE ON categories BEGIN
+            UPDATE books_fts SET category_name = NULL
+            WHERE rowid IN (SELECT id FROM books WHERE category_id = old.id);
+        END
+        ''',
+        '''
+        INSERT INTO books_fts (rowid, title, author, genre, isbn, category_name)
+        SELECT b.id, b.title, b.author, b.genre, replace(b.isbn, '-', ''), c.name
+        FROM books b
+        LEFT JOIN categories c ON b.category_id = c.id
+        ''',
+    ]),
+    (4, 'availability change log', [
+        # Books whose loans changed since the last availability sync
+        '''
+        CREATE TABLE IF NOT EXISTS availability_dirty (
+            book_id INTEGER PRIMARY KEY
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS availability_dirty_borrow_insert AFTER INSERT ON borrow_log BEGIN
+            INSERT OR IGNORE INTO availability_dirty (book_id) VALUES (new.book_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS availability_dirty_borrow_update
+        AFTER UPDATE OF returned, book_id ON borrow_log BEGIN
+            INSERT OR IGNORE INTO availability_dirty (book_id) VALUES (old.book_id);
+            INSERT OR IGNORE INTO availability_dirty (book_id) VALUES (new.book_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS availability_dirty_borrow_delete AFTER DELETE ON borrow_log BEGIN
+            INSERT OR IGNORE INTO availability_dirty (book_id) VALUES (old.book_id);
+        END
+        ''',
+        # Manual edits of the flag (manage_books) can drift from the log as well
+        '''
+        CREATE TRIGGER IF NOT EXISTS availability_dirty_book_update AFTER UPDATE OF available ON books BEGIN
+            INSERT OR IGNORE INTO availability_dirty (book_id) VALUES (new.id);
+        END
+        ''',
+    ]),
+    (5, 'maintained statistics counters', [
+        '''
+        CREATE TABLE IF NOT EXISTS library_stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0,
+            refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        INSERT OR REPLACE INTO library_stats (name, value)
+        SELECT 'total_books', COUNT(*) FROM books
+        UNION ALL SELECT 'available_books', COUNT(*) FROM books WHERE available = 1
+        UNION ALL SELECT 'total_students', COUNT(*) FROM users WHERE role = 'student'
+        UNION ALL SELECT 'total_borrows', COUNT(*) FROM borrow_log
+        UNION ALL SELECT 'current_borrows', COUNT(*) FROM borrow_log WHERE returned = 0
+        UNION ALL SELECT 'overdue_books', COUNT(*) FROM borrow_log WHERE returned = 0 AND due_date < CURRENT_DATE
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_book_insert AFTER INSERT ON books BEGIN
+            UPDATE library_stats SET value = value + 1 WHERE name = 'total_books';
+            UPDATE library_stats SET value = value + 1 WHERE name = 'available_books' AND new.available = 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_book_delete AFTER DELETE ON books BEGIN
+            UPDATE library_stats SET value = value - 1 WHERE name = 'total_books';
+            UPDATE library_stats SET value = value - 1 WHERE name = 'available_books' AND old.available = 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_book_available AFTER UPDATE OF available ON books
+        WHEN (old.available = 1) IS NOT (new.available = 1) BEGIN
+            UPDATE library_stats SET value = value + (CASE WHEN new.available = 1 THEN 1 ELSE -1 END)
+            WHERE name = 'available_books';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_user_insert AFTER INSERT ON users
+        WHEN new.role = 'student' BEGIN
+            UPDATE library_stats SET value = value + 1 WHERE name = 'total_students';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_user_delete AFTER DELETE ON users
+        WHEN old.role = 'student' BEGIN
+            UPDATE library_stats SET value = value - 1 WHERE name = 'total_students';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_user_role AFTER UPDATE OF role ON users
+        WHEN (old.role = 'student') IS NOT (new.role = 'student') BEGIN
+            UPDATE library_stats SET value = value + (CASE WHEN new.role = 'student' THEN 1 ELSE -1 END)
+            WHERE name = 'total_students';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_borrow_insert AFTER INSERT ON borrow_log BEGIN
+            UPDATE library_stats SET value = value + 1 WHERE name = 'total_borrows';
+            UPDATE library_stats SET value = value + 1 WHERE name = 'current_borrows' AND new.returned = 0;
+            UPDATE library_stats SET value = value + 1
+            WHERE name = 'overdue_books' AND new.returned = 0 AND new.due_date < CURRENT_DATE;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_borrow_delete AFTER DELETE ON borrow_log BEGIN
+            UPDATE library_stats SET value = value - 1 WHERE name = 'total_borrows';
+            UPDATE library_stats SET value = value - 1 WHERE name = 'current_borrows' AND old.returned = 0;
+            UPDATE library_stats SET value = value - 1
+            WHERE name = 'overdue_books' AND old.returned = 0 AND old.due_date < CURRENT_DATE;
+        END
+        ''',
+        # Loans only become overdue with the passage of time, which no trigger sees;
+        # library_stats.refresh_stats() recounts overdue_books on a timer
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_borrow_returned AFTER UPDATE OF returned ON borrow_log
+        WHEN (old.returned = 0) IS NOT (new.returned = 0) BEGIN
+            UPDATE library_stats SET value = value + (CASE WHEN new.returned = 0 THEN 1 ELSE -1 END)
+            WHERE name = 'current_borrows';
+            UPDATE library_stats SET value = value + (CASE WHEN new.returned = 0 THEN 1 ELSE -1 END)
+            WHERE name = 'overdue_books' AND old.due_date < CURRENT_DATE;
+        END
+        ''',
+    ]),
+    (6, 'per-user data versions', [
+        # Bumped on every borrow, return, history or fine change for a user; caches
+        # keyed by (user_id, version) can never serve stale data, in any worker
+        '''
+        CREATE TABLE IF NOT EXISTS user_data_version (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS user_data_version_borrow_log_insert AFTER INSERT ON borrow_log BEGIN
+            INSERT INTO user_data_version (user_id, version) VALUES (new.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS user_data_version_borrow_log_update AFTER UPDATE ON borrow_log BEGIN
+            INSERT INTO user_data_version (user_id, version) VALUES (new.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS user_data_version_borrow_log_delete AFTER DELETE ON borrow_log BEGIN
+            INSERT INTO user_data_version (user_id, version) VALUES (old.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS user_data_version_reading_history_insert AFTER INSERT ON reading_history BEGIN
+            INSERT INTO user_data_version (user_id, version) VALUES (new.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS user_data_version_reading_history_update AFTER UPDATE ON reading_history BEGIN
+            INSERT INTO user_data_version (user_id, version) VALUES (new.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS user_data_version_reading_history_delete AFTER DELETE ON reading_history BEGIN
+            INSERT INTO user_data_version (user_id, version) VALUES (old.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS user_data_version_fines_insert AFTER INSERT ON fines BEGIN
+            INSERT INTO user_data_version (user_id, version) VALUES (new.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS user_data_version_fines_update AFTER UPDATE ON fines BEGIN
+            INSERT INTO user_data_version (user_id, version) VALUES (new.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS user_data_version_fines_delete AFTER DELETE ON fines BEGIN
+            INSERT INTO user_data_version (user_id, version) VALUES (old.user_id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS user_data_version_users_update AFTER UPDATE ON users BEGIN
+            INSERT INTO user_data_version (user_id, version) VALUES (new.id, 1)
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        END
+        ''',
+    ]),
+    (7, 'typed date columns', [
+        # DATE values as 'YYYY-MM-DD', TIMESTAMP values as 'YYYY-MM-DD HH:MM:SS' (row_types.py)
+        _retype_borrow_log,
+        '''
+        UPDATE reading_history SET borrow_date = datetime(borrow_date)
+        WHERE datetime(borrow_date) IS NOT NULL AND borrow_date IS NOT datetime(borrow_date)
+        ''',
+        '''
+        UPDATE reading_history SET return_date = datetime(return_date)
+        WHERE datetime(return_date) IS NOT NULL AND return_date IS NOT datetime(return_date)
+        ''',
+    ]),
+    (8, 'fines linked to loans', [
+        # Accrued overdue fines point at their loan; manual fines keep borrow_id NULL
+        'ALTER TABLE fines ADD COLUMN borrow_id INTEGER REFERENCES borrow_log (id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_fines_borrow ON fines (borrow_id) WHERE borrow_id IS NOT NULL',
+    ]),
+    (9, 'catalog change log', [
+        # Books whose searchable text changed; catalog_index.py replays entries newer than its build
+        '''
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_book_insert AFTER INSERT ON books BEGIN
+            INSERT INTO catalog_changes (book_id) VALUES (new.id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_book_update
+        AFTER UPDATE OF title, author, genre, category_id ON books BEGIN
+            INSERT INTO catalog_changes (book_id) VALUES (new.id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_book_delete AFTER DELETE ON books BEGIN
+            INSERT INTO catalog_changes (book_id) VALUES (old.id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_category_update
+        AFTER UPDATE OF name, description ON categories BEGIN
+            INSERT INTO catalog_changes (book_id) SELECT id FROM books WHERE category_id = new.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS catalog_changes_category_delete AFTER DELETE ON categories BEGIN
+            INSERT INTO catalog_changes (book_id) SELECT id FROM books WHERE category_id = old.id;
+        END
+        ''',
+    ]),
+    (10, 'catalog data version', [
+        # Bumped on every catalog write; response_cache.py keys cached listings on it
+        '''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('catalog', 0)",
+        '''
+        CREATE TRIGGER IF NOT EXISTS data_versions_book_insert AFTER INSERT ON books BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'catalog';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS data_versions_book_update AFTER UPDATE ON books BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'catalog';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS data_versions_book_delete AFTER DELETE ON books BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'catalog';
+        END
+        ''',
+        # Category names are searchable (books_fts.category_name)
+        '''
+        CREATE TRIGGER IF NOT EXISTS data_versions_category_update AFTER UPDATE OF name ON categories BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'catalog';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS data_versions_category_delete AFTER DELETE ON categories BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'catalog';
+        END
+        ''',
+    ]),
+    (11, 'image processing jobs', [
+        # One row per uploaded profile picture / cover, processed by image_pipeline.py
+        '''
+        CREATE TABLE IF NOT EXISTS image_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            target_id INTEGER NOT NULL,
+            original TEXT NOT NULL, -- <digest>.<ext> under the kind's originals/ folder
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        ''',
+        # "Is there a newer upload for this row?" when a job finishes
+        'CREATE INDEX IF NOT EXISTS idx_image_jobs_target ON image_jobs (kind, target_id, id)',
+        # Unfinished jobs to resume at startup
+        "CREATE INDEX IF NOT EXISTS idx_image_jobs_pending ON image_jobs (id) WHERE status = 'pending'",
+        # Content-hashed images can be shared between rows: "who else uses this file?"
+        'CREATE INDEX IF NOT EXISTS idx_books_cover_image ON books (cover_image)',
+        'CREATE INDEX IF NOT EXISTS idx_users_profile_pic ON users (profile_pic)',
+    ]),
+    (12, 'catalog import checkpoints', [
+        # One row per import_books.py run; position is committed with each batch so an
+        # interrupted import resumes where it stopped
+        '''
+        CREATE TABLE IF NOT EXISTS import_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            source TEXT NOT NULL,
+            fingerprint TEXT NOT NULL, -- size and mtime: a changed file starts a new run
+            position INTEGER NOT NULL DEFAULT 0, -- input records already committed
+            inserted INTEGER NOT NULL DEFAULT 0,
+            duplicates INTEGER NOT NULL DEFAULT 0,
+            invalid INTEGER NOT NULL DEFAULT 0,
+            first_book_id INTEGER NOT NULL, -- books after this id were loaded by the run
+            suspended TEXT, -- JSON [name, sql] of triggers/indexes dropped for the load
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_import_runs_source ON import_runs (source, fingerprint, id)',
+        'CREATE INDEX IF NOT EXISTS idx_import_runs_suspended ON import_runs (id) WHERE suspended IS NOT NULL',
+        # ISBN duplicate check ignoring hyphens, as admins type them either way
+        "CREATE INDEX IF NOT EXISTS idx_books_isbn_compact ON books (replace(isbn, '-', ''))",
+    ]),
+    (13, 'export date ranges', [
+        # exports.py reads reading history in borrow_date order, optionally for a date range
+        'CREATE INDEX IF NOT EXISTS idx_reading_history_borrow_date ON reading_history (borrow_date)',
+    ]),
+    (14, 'fine totals counters', [
+        # Amounts are counted in whole cents so the counters stay exact integers
+        '''
+        INSERT OR REPLACE INTO library_stats (name, value)
+        SELECT 'total_fines', COUNT(*) FROM fines
+        UNION ALL SELECT 'unpaid_fine_cents', COALESCE(SUM(CAST(ROUND(amount * 100) AS INTEGER)), 0)
+                  FROM fines WHERE paid = 0
+        UNION ALL SELECT 'paid_fine_cents', COALESCE(SUM(CAST(ROUND(amount * 100) AS INTEGER)), 0)
+                  FROM fines WHERE paid = 1
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_fine_insert AFTER INSERT ON fines BEGIN
+            UPDATE library_stats SET value = value + 1 WHERE name = 'total_fines';
+            UPDATE library_stats SET value = value + CAST(ROUND(new.amount * 100) AS INTEGER)
+            WHERE name = (CASE WHEN new.paid = 1 THEN 'paid_fine_cents' ELSE 'unpaid_fine_cents' END);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_fine_delete AFTER DELETE ON fines BEGIN
+            UPDATE library_stats SET value = value - 1 WHERE name = 'total_fines';
+            UPDATE library_stats SET value = value - CAST(ROUND(old.amount * 100) AS INTEGER)
+            WHERE name = (CASE WHEN old.paid = 1 THEN 'paid_fine_cents' ELSE 'unpaid_fine_cents' END);
+        END
+        ''',
+        # Paying a fine moves it between the totals; fine_engine.py re-accruing one changes its amount
+        '''
+        CREATE TRIGGER IF NOT EXISTS library_stats_fine_update AFTER UPDATE OF amount, paid ON fines BEGIN
+            UPDATE library_stats SET value = value - CAST(ROUND(old.amount * 100) AS INTEGER)
+            WHERE name = (CASE WHEN old.paid = 1 THEN 'paid_fine_cents' ELSE 'unpaid_fine_cents' END);
+            UPDATE library_stats SET value = value + CAST(ROUND(new.amount * 100) AS INTEGER)
+            WHERE name = (CASE WHEN new.paid = 1 THEN 'paid_fine_cents' ELSE 'unpaid_fine_cents' END);
+        END
+        ''',
+    ]),
+    # overdue_books holds the open loans that were overdue at its last recount
+    # (refresh_stats() stamps refreshed_at), plus or minus the changes since. A loan that
+    # went overdue after that is not in it, so every trigger compares due dates with the
+    # recount's date rather than today: returning such a loan no longer takes one off
+    # the loans that are counted
+    (15, 'overdue counter follows its last recount', [
+        'DROP TRIGGER IF EXISTS library_stats_borrow_insert',
+        '''
+        CREATE TRIGGER library_stats_borrow_insert AFTER INSERT ON borrow_log BEGIN
+            UPDATE library_stats SET value = value + 1 WHERE name = 'total_borrows';
+            UPDATE library_stats SET value = value + 1 WHERE name = 'current_borrows' AND new.returned = 0;
+            UPDATE library_stats SET value = value + 1
+            WHERE name = 'overdue_books' AND new.returned = 0 AND new.due_date < date(refreshed_at);
+        END
+        ''',
+        'DROP TRIGGER IF EXISTS library_stats_borrow_delete',
+        '''
+        CREATE TRIGGER library_stats_borrow_delete AFTER DELETE ON borrow_log BEGIN
+            UPDATE library_stats SET value = value - 1 WHERE name = 'total_borrows';
+            UPDATE library_stats SET value = value - 1 WHERE name = 'current_borrows' AND old.returned = 0;
+            UPDATE library_stats SET value = value - 1
+            WHERE name = 'overdue_books' AND old.returned = 0 AND old.due_date < date(refreshed_at);
+        END
+        ''',
+        'DROP TRIGGER IF EXISTS library_stats_borrow_returned',
+        '''
+        CREATE TRIGGER library_stats_borrow_returned AFTER UPDATE OF returned ON borrow_log
+        WHEN (old.returned = 0) IS NOT (new.returned = 0) BEGIN
+            UPDATE library_stats SET value = value + (CASE WHEN new.returned = 0 THEN 1 ELSE -1 END)
+            WHERE name = 'current_borrows';
+            UPDATE library_stats SET value = value + (CASE WHEN new.returned = 0 THEN 1 ELSE -1 END)
+            WHERE name = 'overdue_books' AND old.due_date < date(refreshed_at);
+        END
+        ''',
+    ]),
+]
+
+
+def current_version(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn, migrations=MIGRATIONS):
+    """Bring the database up to the latest version, returns the versions applied.
+
+    Each migration runs in its own BEGIN IMMEDIATE transaction together with its
+    schema_version row, so a worker that starts while another is migrating simply
+    waits on the write lock and then sees the step as already applied. Readers are
+    not blocked in WAL mode, which keeps this safe to run against a live database.
+    """
+    applied = []
+    current_version(conn)
+    conn.commit()
+    for version, description, statements in migrations:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Re-check under the write lock in case another process got here first
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                # Steps that SQL alone cannot express are plain functions taking the connection
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (version, description))
+            conn.commit()
+            applied.append(version)
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return applied
+
+
+if __name__ == '__main__':
+    import sys
+    conn = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else 'books.db')
+    print(f"Schema version before: {current_version(conn)}")
+    print(f"Applied migrations: {apply_migrations(conn) or 'none'}")
+    conn.close()
@@ -0,0 +1,104 @@
+import base64
+import json
+
+
+def encode_cursor(values, direction, page):
+    # str() of a date/datetime key is exactly its stored text form (row_types.py)
+    payload = json.dumps({'k': list(values), 'd': direction, 'p': page}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Returns (values, direction, page) or None for a missing/garbled token."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return payload['k'], payload['d'], int(payload['p'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def clamp_page_size(value, default, maximum):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(value, maximum))
+
+
+def empty_page(per_page, page=1):
+    return {
+        'page': page,
+        'per_page': per_page,
+        'has_prev': False,
+        'has_next': False,
+        'prev_cursor': None,
+        'next_cursor': None,
+    }
+
+
+def keyset_page(conn, sql, params, keys, cursor=None, per_page=25, descending=False):
+    """Fetch one page of ``sql`` by seeking past the cursor instead of using OFFSET.
+
+    ``sql`` is a SELECT ending in a WHERE clause (use ``WHERE 1=1`` when there are no
+    filters). ``keys`` is a list of (sql_expression, row_column) pairs forming a unique
+    sort key, e.g. ``[('b.title', 'title'), ('b.id', 'id')]``; the row columns must be
+    selected by ``sql``. With an index on the key every page costs the same, page 500
+    included.
+
+    Returns (rows, pagination) where pagination holds has_prev/has_next and the
+    prev_cursor/next_cursor tokens to pass back as ``cursor``.
+    """
+    decoded = decode_cursor(cursor)
+    values, direction, page = decoded if decoded else (None, 'next', 1)
+    if values is not None and len(values) != len(keys):
+        values, direction, page = None, 'next', 1
+
+    expressions = ', '.join(expr for expr, _ in keys)
+    # Walking backwards flips both the seek comparison and the sort order
+    backwards = direction == 'prev'
+    reverse = descending != backwards
+    query = sql
+    params = list(params)
+    if values is not None:
+        placeholders = ', '.join('?' for _ in keys)
+        query += f" AND ({expressions}) {'<' if reverse else '>'} ({placeholders})"
+        params.extend(values)
+    order = ' DESC' if reverse else ''
+    query += ' ORDER BY ' + ', '.join(expr + order for expr, _ in keys)
+    query += ' LIMIT ?'
+    params.append(per_page + 1)
+
+    rows = conn.execute(query, params).fetchall()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if values is None:
+        has_prev, has_next = False, more
+    elif backwards:
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = True, more
+
+    columns = [column for _, column in keys]
+    pagination = empty_page(per_page, page)
+    pagination['has_prev'] = has_prev and bool(rows)
+    pagination['has_next'] = has_next and bool(rows)
+    if pagination['has_prev']:
+        pagination['prev_cursor'] = encode_cursor([rows[0][c] for c in columns], 'prev', max(page - 1, 1))
+    if pagination['has_next']:
+        pagination['next_cursor'] = encode_cursor([rows[-1][c] for c in columns], 'next', page + 1)
+    return rows, pagination
+
+
+def estimate_count(conn, table):
+    """Cheap row count estimate: the highest rowid, an O(log n) lookup.
+
+    Exact for append-only tables and an upper bound once rows have been deleted,
+    which is good enough for a "page x of ~y" hint.
+    """
+    return conn.execute(f'SELECT MAX(rowid) FROM {table}').fetchone()[0] or 0
@@ -0,0 +1,141 @@
+"""On-demand sampling profiler for single requests.
+
+An admin adds ``X-Profile: 1`` to a request (or ``?profile=1`` to its URL) and
+that one request is sampled: a helper thread reads the request thread's Python
+stack every PROFILE_INTERVAL seconds until the response has been sent, streamed
+bodies included. The stacks are written to PROFILE_DIR in the collapsed format
+flamegraph.pl, speedscope and inferno read ("outer;inner;leaf count" per line)
+and the file name is returned in the X-Profile response header.
+
+SQLite releases the GIL while it steps a statement, so time spent in SQL shows up
+under the frame that called execute()/fetchall(); row conversion (row_types.py)
+and Jinja rendering appear as their own Python frames.
+
+Requests without the flag pay for one header and one query-string lookup; no
+thread is started and nothing is hooked into the interpreter.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import g, request, session
+
+SUFFIX = '.folded'
+
+
+def _frame_name(code):
+    return f'{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler(threading.Thread):
+    """Counts the collapsed stacks of one thread until stop() is called."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='Request profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class RequestProfiler:
+    def __init__(self, directory, interval=0.005, keep=100):
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._name_profile)
+        app.teardown_request(self._finish)
+
+    def _requested(self):
+        return request.headers.get('X-Profile') or request.args.get('profile')
+
+    def _start(self):
+        if not self._requested() or session.get('role') != 'admin' or not session.get('logged_in'):
+            return
+        g.profile_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unmatched'}-{uuid.uuid4().hex[:6]}"
+        g.profiler = StackSampler(threading.get_ident(), self.interval)
+        g.profiler.start()
+
+    def _name_profile(self, response):
+        sampler = g.get('profiler')
+        if sampler is not None:
+            name = g.profile_name
+            response.headers['X-Profile'] = name + SUFFIX
+            if response.is_streamed:
+                # Keep sampling while the body is generated, after teardown_request
+                g.profile_streaming = True
+                response.call_on_close(lambda: self._save_sampler(name, sampler))
+        return response
+
+    def _finish(self, exc):
+        if g.get('profile_streaming'):
+            return
+        sampler = g.pop('profiler', None)
+        if sampler is not None:
+            self._save_sampler(g.profile_name, sampler)
+
+    def _save_sampler(self, name, sampler):
+        sampler.stop()
+        self.save(name, sampler.stacks)
+
+    def save(self, name, stacks):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, name + SUFFIX)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        os.replace(path + '.tmp', path)
+        # Names start with a timestamp: keep the newest ``keep`` profiles
+        for old in self.list_names()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except FileNotFoundError:
+                pass
+
+    def list_names(self):
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(SUFFIX)]
+        except FileNotFoundError:
+            return []
+        return sorted(names, reverse=True)
+
+    def list_profiles(self):
+        """Newest first: name, endpoint, samples and the estimated milliseconds they cover."""
+        profiles = []
+        for name in self.list_names():
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    samples = sum(int(line.rsplit(' ', 1)[1]) for line in f if line.strip())
+            except (OSError, ValueError, IndexError):
+                continue
+            stamp, _, rest = name[:-len(SUFFIX)].partition('-')
+            time_part, _, rest = rest.partition('-')
+            endpoint = rest.rsplit('-', 1)[0]
+            profiles.append({
+                'name': name,
+                'started': f'{stamp[:4]}-{stamp[4:6]}-{stamp[6:]} {time_part[:2]}:{time_part[2:4]}:{time_part[4:]}',
+                'endpoint': endpoint,
+                'samples': samples,
+                'sampled_ms': round(samples * self.interval * 1000),
+            })
+        return profiles
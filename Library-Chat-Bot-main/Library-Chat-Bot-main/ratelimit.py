@@ -0,0 +1,270 @@
+"""Rate limiting for /chat and the login forms.
+
+Limits are written like the RATELIMIT_* settings: "50 per hour", "10/minute",
+"5 per 10 seconds", several separated by ';'. A view is limited with
+
+  @limiter.limit('chat', (app.config['RATELIMIT_CHAT'], session_user),
+                         (app.config['RATELIMIT_CHAT_IP'], remote_addr))
+
+where each key function names the client a rule applies to ('user:3',
+'ip:10.0.0.7', ...) or returns None to skip the rule for this request. Every
+limit of every rule is its own bucket, and one request is checked against all of
+them at once: it is let through only if none is exhausted, and only then counted.
+With charge_if=rejected (the login forms) requests are only checked up front and
+counted once the view has refused them, so successful logins cost nothing.
+Refused requests get a 429 with Retry-After (whole seconds).
+
+Each bucket is a token bucket stored as a single number, its "theoretical
+arrival time" (GCRA): a limit of N per P seconds lets a burst of N through, then
+one more every P/N seconds. A decision reads and writes one value per bucket, so
+it costs the same however busy the client is, and an idle bucket expires on its
+own. Backends (RATELIMIT_STORAGE_URL):
+
+  memory://         buckets in this process; each gunicorn worker counts its own
+  sqlite:///path    buckets in a small SQLite file shared by every worker, kept
+                    apart from the library database so limiting never waits on
+                    or adds to its write lock
+
+If the shared file cannot be used (locked past its timeout, disk full) requests
+are let through and a warning is logged: a limiter outage must not take the
+login and chat down with it.
+"""
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, make_response, request, session
+
+UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT = re.compile(r'^\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$', re.IGNORECASE)
+
+logger = logging.getLogger('library.ratelimit')
+
+
+def parse_limits(text):
+    """'200 per day;50 per hour' -> [(200, 86400), (50, 3600)]: (requests, seconds)."""
+    limits = []
+    for part in text.split(';'):
+        if not part.strip():
+            continue
+        match = _LIMIT.match(part)
+        if not match or int(match.group(1)) < 1:
+            raise ValueError(f'Invalid rate limit: {part.strip()!r}')
+        count, multiple, unit = match.groups()
+        limits.append((int(count), int(multiple or 1) * UNITS[unit.lower()]))
+    return limits
+
+
+def decide(buckets, tats, now):
+    """GCRA over several buckets at once: (new arrival times, 0) or (None, seconds to wait).
+
+    ``buckets`` are (key, count, period) and ``tats`` their stored arrival times
+    (None for a new bucket). A request is allowed when, after adding its cost of
+    period/count, no bucket's arrival time runs more than a period ahead of now.
+    """
+    new_tats = []
+    retry_after = 0
+    for (_, count, period), tat in zip(buckets, tats):
+        new_tat = max(tat or now, now) + period / count
+        # The tolerance keeps float rounding from refusing the last request of a burst
+        if new_tat - now > period + 1e-9:
+            retry_after = max(retry_after, new_tat - period - now)
+        new_tats.append(new_tat)
+    if retry_after:
+        return None, retry_after
+    return new_tats, 0
+
+
+class MemoryStorage:
+    """Buckets in this process, least recently hit first."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._tats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, buckets, record=True):
+        now = time.monotonic()
+        with self._lock:
+            new_tats, retry_after = decide(buckets, [self._tats.get(key) for key, _, _ in buckets], now)
+            if new_tats is None or not record:
+                return retry_after
+            for (key, _, _), tat in zip(buckets, new_tats):
+                self._tats[key] = tat
+                self._tats.move_to_end(key)
+            # A bucket whose arrival time has passed is full again, the same as no bucket:
+            # retire a couple of those per hit, and the least recent beyond max_keys
+            for _ in range(2):
+                key, tat = next(iter(self._tats.items()))
+                if tat > now:
+                    break
+                del self._tats[key]
+            while len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+        return 0
+
+    def clear(self):
+        with self._lock:
+            self._tats.clear()
+
+
+class SQLiteStorage:
+    """Buckets in a SQLite file shared by every worker; one connection per thread."""
+
+    PRUNE_INTERVAL = 60  # seconds between sweeps of expired buckets, per process
+
+    def __init__(self, path, timeout=2):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._next_prune = 0
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            # Losing the last few hits in a power cut only makes the limiter briefly lenient
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID')
+            self._local.conn = conn
+        return conn
+
+    def hit(self, buckets, record=True):
+        conn = self._connection()
+        # Wall-clock time: the file outlives processes, and monotonic clocks restart with them
+        now = time.time()
+        # A check without recording only reads, and takes no write lock
+        conn.execute('BEGIN IMMEDIATE' if record else 'BEGIN')
+        try:
+            tats = []
+            for key, _, _ in buckets:
+                row = conn.execute('SELECT tat FROM rate_limits WHERE key = ?', (key,)).fetchone()
+                tats.append(row[0] if row else None)
+            new_tats, retry_after = decide(buckets, tats, now)
+            if new_tats is not None and record:
+                conn.executemany('INSERT INTO rate_limits (key, tat) VALUES (?, ?) '
+                                 'ON CONFLICT (key) DO UPDATE SET tat = excluded.tat',
+                                 [(key, tat) for (key, _, _), tat in zip(buckets, new_tats)])
+            if record and now >= self._next_prune:
+                # A scan, but of active clients only and once a minute; an index on tat
+                # would cost every hit an extra write
+                conn.execute('DELETE FROM rate_limits WHERE tat < ?', (now,))
+                self._next_prune = now + self.PRUNE_INTERVAL
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        return retry_after
+
+    def clear(self):
+        self._connection().execute('DELETE FROM rate_limits')
+
+
+def storage_from_url(url):
+    """memory:// or sqlite:///relative/path.db (sqlite:////absolute/path.db)."""
+    if url == 'memory://':
+        return MemoryStorage()
+    if url.startswith('sqlite:///') and len(url) > len('sqlite:///'):
+        return SQLiteStorage(url[len('sqlite:///'):])
+    raise ValueError(f'Unsupported RATELIMIT_STORAGE_URL: {url!r}')
+
+
+# Key functions: who a rule counts against, or None when it does not apply
+
+def remote_addr():
+    # The client's address once PROXY_FIX_X_FOR has applied X-Forwarded-For (server.py)
+    return f"ip:{request.remote_addr or 'unknown'}"
+
+
+def session_user():
+    if session.get('logged_in') and session.get('user_id') is not None:
+        return f"user:{session['user_id']}"
+    return None
+
+
+def form_username():
+    # The account being logged into, so guessing one password is slow from any number of IPs
+    username = request.form.get('username', '').strip().lower()
+    return f'username:{username[:150]}' if username else None
+
+
+def rejected(response):
+    # charge_if for the login forms: only refused credentials count against the budgets
+    return response.status_code in (401, 403)
+
+
+def too_many_requests(retry_after):
+    # Both reply shapes the front-end reads: {"response"} from /chat and
+    # {"success", "message"} from the login forms
+    message = f"⏳ Too many requests. Please wait {retry_after} seconds and try again."
+    response = jsonify({'success': False, 'message': message, 'response': message, 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+class RateLimiter:
+    def __init__(self, storage, enabled=True):
+        self.storage = storage
+        self.enabled = enabled
+        # observer(scope) for every refused request (see AppMetrics.observe_limiter)
+        self.observers = []
+
+    def limit(self, scope, *rules, charge_if=None):
+        """Decorate a view with (limits text, key function) rules; buckets are named by ``scope``.
+
+        With ``charge_if``, a predicate on the view's response, every request is checked
+        but only counted when the predicate holds for its response.
+        """
+        parsed = [(parse_limits(text), key_func) for text, key_func in rules]
+
+        def decorator(view):
+            @wraps(view)
+            def limited(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+                retry_after = self.hit(scope, parsed, record=charge_if is None)
+                if retry_after:
+                    return too_many_requests(retry_after)
+                if charge_if is None:
+                    return view(*args, **kwargs)
+                response = make_response(view(*args, **kwargs))
+                if charge_if(response):
+                    self.hit(scope, parsed, observe=False)
+                return response
+            return limited
+        return decorator
+
+    def hit(self, scope, rules, record=True, observe=True):
+        """Count one request; 0 when it may go ahead, else the whole seconds to wait.
+
+        ``record=False`` only checks. A refused request is reported to the observers
+        unless ``observe`` is False (charging one the view already answered).
+        """
+        buckets = []
+        for limits, key_func in rules:
+            key = key_func()
+            if key is None:
+                continue
+            buckets += [(f'{scope}:{key}:{count}/{period}', count, period) for count, period in limits]
+        if not buckets:
+            return 0
+        try:
+            retry_after = self.storage.hit(buckets, record)
+        except sqlite3.Error as e:
+            logger.warning('Rate limiter storage failed, letting the request through: %s', e)
+            return 0
+        if not retry_after:
+            return 0
+        for observer in self.observers if observe else ():
+            observer(scope)
+        return max(1, math.ceil(retry_after))
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Versions are bumped by triggers (migration 10 for the catalog, migration 6 for users)
+# on every write, whichever worker or script makes it.
+CATALOG_VERSION_SQL = "SELECT version FROM data_versions WHERE name = 'catalog'"
+USER_VERSION_SQL = 'SELECT version FROM user_data_version WHERE user_id = ?'
+
+
+def catalog_version(conn):
+    row = conn.execute(CATALOG_VERSION_SQL).fetchone()
+    return row[0] if row else 0
+
+
+def user_version(conn, user_id):
+    row = conn.execute(USER_VERSION_SQL, (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+class ResponseCache:
+    """Per-worker LRU + TTL cache whose entries are only valid for the data version they were built from.
+
+    Callers read the version first and the data second, so an entry can only ever be
+    newer than the version it is stored under: a write in between makes the next lookup
+    miss, never serve stale data. The TTL just retires entries nobody asks for.
+    """
+
+    def __init__(self, max_entries=2048, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get_or_load(self, key, version, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires_at, value = entry
+                if entry_version == version and expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                if expires_at <= now:
+                    self.expirations += 1
+                del self._entries[key]
+            self.misses += 1
+        value = load()
+        with self._lock:
+            self._entries[key] = (version, now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,54 @@
+import sqlite3
+from datetime import date, datetime
+
+# Storage conventions (see migration 7):
+#   DATE      -> 'YYYY-MM-DD'
+#   TIMESTAMP -> 'YYYY-MM-DD HH:MM:SS'
+#   BOOLEAN   -> 0 / 1
+# Connections opened with detect_types=PARSE_DECLTYPES get Python objects back for
+# any column declared with one of these types, converted once inside the driver
+# instead of by strptime/fromisoformat loops in every route. Values that do not
+# parse are returned as the original string, like the old loops did.
+
+
+def _convert_date(value):
+    text = value.decode()
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        try:
+            return datetime.fromisoformat(text).date()
+        except ValueError:
+            return text
+
+
+def _convert_timestamp(value):
+    text = value.decode()
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        return text
+
+
+def _convert_boolean(value):
+    try:
+        return bool(int(value))
+    except ValueError:
+        return value.decode()
+
+
+def _adapt_date(value):
+    return value.isoformat()
+
+
+def _adapt_datetime(value):
+    return value.isoformat(' ', 'seconds')
+
+
+def register_types():
+    # Converter names are matched case-insensitively against the declared column type
+    sqlite3.register_converter('DATE', _convert_date)
+    sqlite3.register_converter('TIMESTAMP', _convert_timestamp)
+    sqlite3.register_converter('BOOLEAN', _convert_boolean)
+    sqlite3.register_adapter(date, _adapt_date)
+    sqlite3.register_adapter(datetime, _adapt_datetime)
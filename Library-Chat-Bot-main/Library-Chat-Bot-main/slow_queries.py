@@ -0,0 +1,125 @@
+"""Slow-query log: statements over SLOW_QUERY_THRESHOLD, with their query plans.
+
+Every pooled conn.execute()/executemany() taking longer than the threshold is
+written to the 'library.slow_queries' logger (a rotating file set up by
+Config.init_app) as one JSON object per line:
+
+  {"time": ..., "seconds": 0.84, "sql": "SELECT ... WHERE u.role = ? ...",
+   "params": ["str"], "route": "manage_students", "plan": ["SCAN u", ...]}
+
+``sql`` is normalized (whitespace collapsed, literals replaced by ?), so every
+run of one query groups together; ``params`` is the shape of the bound values,
+never the values themselves. ``route`` is the Flask endpoint, or the thread name
+outside a request (e.g. 'Fine accrual'). The plan is EXPLAIN QUERY PLAN run on
+the same connection right after the statement.
+
+Durations cover preparing the statement and stepping to its first row (see
+ConnectionPool.add_statement_hook), which for joins, sorts and GROUP BY is nearly
+all of the work. top_offenders() reads the log files back for /admin/slow_queries;
+all workers write to the same files, so the page covers every worker.
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import has_request_context, request
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+_EXPLAINABLE = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH'}
+
+
+def normalize_sql(sql):
+    """One line, string and number literals replaced by ?."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def parameter_shape(parameters):
+    """Type names of the bound values: ['int', 'str'], {'today': 'str'}, or 'executemany'."""
+    if parameters is None:
+        return 'executemany'
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+
+def explain(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN details, indented by depth; [] for statements without a plan."""
+    words = sql.split(None, 1)
+    if parameters is None or not words or words[0].upper() not in _EXPLAINABLE:
+        return []
+    try:
+        # sqlite3.Connection.execute directly: not timed again by the statement hooks
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    except sqlite3.Error as e:
+        return [f'(no plan: {e})']
+    depth = {0: 0}
+    plan = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        plan.append('  ' * (depth[node_id] - 1) + detail)
+    return plan
+
+
+class SlowQueryLog:
+    def __init__(self, logger, threshold):
+        self.logger = logger
+        self.threshold = threshold
+
+    def init_app(self, pool):
+        pool.add_statement_hook(self.record)
+
+    def record(self, conn, sql, parameters, seconds):
+        if seconds < self.threshold:
+            return
+        plan = explain(conn, sql, parameters)
+        route = request.endpoint if has_request_context() else threading.current_thread().name
+        self.logger.warning(json.dumps({
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'seconds': round(seconds, 4),
+            'sql': normalize_sql(sql),
+            'params': parameter_shape(parameters),
+            'route': route,
+            'plan': plan,
+        }))
+
+
+def _log_files(path, backups):
+    # Oldest first, so the newest plan and time win when records are folded together
+    candidates = [f'{path}.{n}' for n in range(backups, 0, -1)] + [path]
+    return [candidate for candidate in candidates if os.path.exists(candidate)]
+
+
+def top_offenders(path, backups=5, limit=50):
+    """Logged statements grouped by normalized SQL, most total time first."""
+    offenders = {}
+    for filename in _log_files(path, backups):
+        with open(filename, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                offender = offenders.get(entry['sql'])
+                if offender is None:
+                    offender = offenders[entry['sql']] = {
+                        'sql': entry['sql'], 'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                        'routes': {}, 'params': entry['params'],
+                    }
+                offender['count'] += 1
+                offender['total_seconds'] += entry['seconds']
+                offender['max_seconds'] = max(offender['max_seconds'], entry['seconds'])
+                offender['routes'][entry['route']] = offender['routes'].get(entry['route'], 0) + 1
+                offender['last_seen'] = entry['time']
+                offender['plan'] = entry['plan']
+    ranked = sorted(offenders.values(), key=lambda offender: offender['total_seconds'], reverse=True)[:limit]
+    for offender in ranked:
+        offender['total_seconds'] = round(offender['total_seconds'], 4)
+        offender['mean_seconds'] = round(offender['total_seconds'] / offender['count'], 4)
+    return ranked
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+USER_SQL = 'SELECT * FROM users WHERE id = ?'
+
+
+def user_record(row):
+    # What g.current_user holds: the user's columns minus the password, which is
+    # only ever read from the database (logins, password changes)
+    record = dict(row)
+    record.pop('password', None)
+    return record
+
+
+class UserCache:
+    """Per-worker LRU + TTL cache of user rows by id, behind g.current_user.
+
+    Unlike ResponseCache there is no version check: a hit costs no query at all.
+    Writes through this worker (profile edits, manage_students, password resets,
+    finished profile pictures) call invalidate(); writes made by another worker
+    show up here once the entry's TTL runs out, so keep the TTL short.
+    """
+
+    def __init__(self, max_entries=4096, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by invalidate(), so a load that raced an invalidation is not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, get_connection):
+        """The user's record, loaded with a pooled connection on a miss; None if there is no such user."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        conn = get_connection()
+        try:
+            row = conn.execute(USER_SQL, (user_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return self._store(user_id, user_record(row), generation)
+
+    def put(self, user_id, row):
+        """Cache a users row the caller just read, e.g. on login."""
+        with self._lock:
+            generation = self._generation
+        return self._store(user_id, user_record(row), generation)
+
+    def _store(self, user_id, record, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._entries[user_id] = (time.monotonic() + self.ttl, record)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return record
+
+    def invalidate(self, user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return  # not a user id (a malformed form field), nothing is cached under it
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }